@@ -7,4 +7,4 @@ request.user.cart_items.delete(product_id)
 request.user.cart_items.set_as_paid(): all products set as paid
 
 """
-import signals
+default_app_config = 'cart.apps.CartConfig'
@@ -1,8 +1,214 @@
+"""Admin of the cart items
+
+The cart table is large, so the changelist
+
+* loads products of the page with one query per product model instead of
+  one query per row;
+* offers only filters served by the CartItem indexes;
+* doesn't count the whole table, see `EstimatedCountPaginator`;
+* exports the selected items to CSV in chunks, the response is streamed.
+
+"""
+import csv
+
+from django.apps import apps
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.contenttypes.models import ContentType
+from django.core.paginator import Paginator
+from django.db import connections
+from django.http import StreamingHttpResponse
+from django.utils import six
+from django.utils.encoding import force_text
+from django.utils.functional import cached_property
+
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:
+    # Django < 1.11
+    from django.db.models.sql.datastructures import EmptyResultSet
+
+from .models import CartItem, ProductMixin, attach_products
+from .utils import object_chunks
+
+
+def get_count_limit():
+    return getattr(settings, 'CART_ADMIN_COUNT_LIMIT', 10000)
+
+
+def get_export_chunk_size():
+    return getattr(settings, 'CART_ADMIN_EXPORT_CHUNK_SIZE', 500)
+
+
+def is_filtered(queryset):
+    compiler = queryset.query.get_compiler(queryset.db)
+    try:
+        sql, _ = queryset.query.where.as_sql(compiler, compiler.connection)
+    except EmptyResultSet:
+        return True
+    return bool(sql)
+
+
+def estimate_count(queryset):
+    """Number of rows of the queryset table from the database statistics
+
+    Returns:
+        int: None if the database doesn't keep the statistics
+
+    """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples FROM pg_class WHERE relname = %s'
+    elif connection.vendor == 'mysql':
+        sql = (
+            'SELECT table_rows FROM information_schema.tables '
+            'WHERE table_schema = DATABASE() AND table_name = %s'
+        )
+    else:
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator which doesn't count all rows of a large table
+
+    Unfiltered queryset is counted from the table statistics when they show
+    more than `CART_ADMIN_COUNT_LIMIT` rows (10000 by default). Filtered one
+    is counted up to the limit, pages after it are not shown.
+
+    """
+    @cached_property
+    def count(self):
+        limit = get_count_limit()
+        if not is_filtered(self.object_list):
+            estimate = estimate_count(self.object_list)
+            if estimate is not None and estimate > limit:
+                return estimate
+        return self.object_list[:limit].count()
+
+
+class CartItemChangeList(ChangeList):
+    def get_results(self, request):
+        super(CartItemChangeList, self).get_results(request)
+        # rows are rendered with CartItem.__str__, which needs the product
+        attach_products(self.result_list)
+
+
+class OwnerTypeFilter(admin.SimpleListFilter):
+    title = 'owner'
+    parameter_name = 'owner'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('user', 'User'),
+            ('session', 'Anonymous'),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'user':
+            return queryset.filter(user__isnull=False)
+        if self.value() == 'session':
+            return queryset.filter(session_key__isnull=False)
+        return queryset
+
+
+class ProductTypeFilter(admin.SimpleListFilter):
+    """Content types of the product models, not all ones of the project"""
+
+    title = 'product type'
+    parameter_name = 'content_type'
+
+    def lookups(self, request, model_admin):
+        models = [
+            model for model in apps.get_models()
+            if issubclass(model, ProductMixin)
+        ]
+        content_types = ContentType.objects.get_for_models(*models)
+        return sorted(
+            (content_type.pk, model._meta.verbose_name)
+            for model, content_type in content_types.items()
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            return queryset.filter(content_type_id=self.value())
+        return queryset
+
+
+class Echo(object):
+    """File-like object which returns what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+EXPORT_FIELDS = (
+    'id', 'created', 'user_id', 'session_key', 'product_type', 'object_id',
+    'title', 'price', 'quantity', 'is_paid',
+)
+
+
+def export_row(item):
+    product_type = ContentType.objects.get_for_id(item.content_type_id)
+    row = [
+        item.pk, item.created.isoformat(), item.user_id, item.session_key,
+        '{}.{}'.format(product_type.app_label, product_type.model),
+        item.object_id, force_text(item), item.price, item.quantity,
+        item.is_paid,
+    ]
+    row = ['' if value is None else force_text(value) for value in row]
+    if six.PY2:
+        row = [value.encode('utf-8') for value in row]
+    return row
+
+
+def export_rows(queryset, chunk_size):
+    """Yield CSV lines of the cart items, products are loaded per chunk"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for chunk in object_chunks(queryset, chunk_size):
+        attach_products(chunk)
+        for item in chunk:
+            yield writer.writerow(export_row(item))
+
+
+def export_csv(modeladmin, request, queryset):
+    response = StreamingHttpResponse(
+        export_rows(queryset, get_export_chunk_size()),
+        content_type='text/csv'
+    )
+    response['Content-Disposition'] = 'attachment; filename="cart_items.csv"'
+    return response
+export_csv.short_description = "Export selected cart items to CSV"
 
-from .models import CartItem
 
 class CartItemAdmin(admin.ModelAdmin):
-    pass
+    list_display = (
+        'id', '__str__', 'product_type', 'owner', 'price', 'quantity',
+        'is_paid', 'created',
+    )
+    list_filter = ('is_paid', OwnerTypeFilter, ProductTypeFilter)
+    ordering = ('-id',)
+    raw_id_fields = ('user', 'session')
+    actions = [export_csv]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return CartItemChangeList
+
+    def product_type(self, obj):
+        return ContentType.objects.get_for_id(obj.content_type_id)
+
+    def owner(self, obj):
+        if obj.user_id:
+            return 'user {}'.format(obj.user_id)
+        return 'session {}'.format(obj.session_key)
 
 admin.site.register(CartItem, CartItemAdmin)
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class CartConfig(AppConfig):
+    name = 'cart'
+
+    def ready(self):
+        # receivers are connected once the models are loaded
+        from . import signals  # noqa
@@ -0,0 +1,43 @@
+"""Move of paid cart items to the archive table
+
+`CART_ARCHIVE_ON_PAY = True` makes `CartManager.set_as_paid` move items to
+PaidCartItem when they are paid. Items paid before that are moved by
+`backfill` in chunks ordered by id, one transaction per chunk, so it can run
+while the site is live.
+
+"""
+import logging
+import time
+
+from django.db import transaction
+
+from .models import CartItem, archive_cart_items
+from .utils import keyset_chunks
+
+
+logger = logging.getLogger("private-project.{}".format(__name__))
+
+
+def backfill(chunk_size=500, sleep=0):
+    """Move paid cart items to PaidCartItem
+
+    Args:
+        chunk_size (int): number of items moved by one transaction
+        sleep (float): seconds to wait after every chunk
+
+    Returns:
+        int: number of moved items
+
+    """
+    moved = 0
+    paid_item_qs = CartItem.objects.filter(is_paid=True)
+    for chunk in keyset_chunks(paid_item_qs, chunk_size, 'id'):
+        with transaction.atomic():
+            moved += archive_cart_items(paid_item_qs.filter(
+                pk__in=[item_id for item_id, in chunk]))
+        logger.debug("%d paid cart items archived", moved)
+
+        if sleep:
+            time.sleep(sleep)
+
+    return moved
@@ -0,0 +1,182 @@
+"""Cache of Tempitura lookups keyed by cart version
+
+Every cart owner has a version number which is bumped by each cart change, so
+cached lookups are invalidated as soon as the cart is changed and can live
+much longer than a blind timeout allows.
+
+Idempotency keys of add-to-cart requests are kept in the same cache, see
+`CartManager.new`.
+
+Settings:
+    CART_CACHE: cache alias, 'default' by default
+    CART_CACHE_TIMEOUT: lifetime of cached lookups in seconds
+    CART_IDEMPOTENCY_TIMEOUT: lifetime of idempotency keys in seconds
+    CART_LOCK_TIMEOUT: max time a cart lock is held or waited for, seconds
+
+"""
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.encoding import force_bytes
+
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'CART_CACHE', 'default')]
+
+
+def owner_key(user_id=None, session_key=None):
+    """Identifier of the cart owner used in the cache keys"""
+    if user_id is not None:
+        return 'user:{}'.format(user_id)
+    return 'session:{}'.format(session_key)
+
+
+def _version_key(owner):
+    return 'cart:version:{}'.format(owner)
+
+
+def _initial_version():
+    # Version lost by the cache backend is started from the current time, so
+    # it doesn't meet entries which were cached with the previous versions
+    return int(time.time() * 1000)
+
+
+def get_version(owner):
+    cache = get_cache()
+    version = cache.get(_version_key(owner))
+    if version is None:
+        version = _initial_version()
+        if not cache.add(_version_key(owner), version, None):
+            version = cache.get(_version_key(owner), version)
+    return version
+
+
+def bump_version(owner):
+    """Invalidate all cached lookups of the owner"""
+    cache = get_cache()
+    try:
+        return cache.incr(_version_key(owner))
+    except ValueError:
+        version = _initial_version()
+        cache.set(_version_key(owner), version, None)
+        return version
+
+
+def get_or_call(owner, name, func, *args, **kwargs):
+    """Return cached result of the call for the current cart version"""
+    cache = get_cache()
+    arguments = repr((args, sorted(kwargs.items()))).encode('utf-8')
+    key = 'cart:{}:{}:{}:{}'.format(
+        owner,
+        get_version(owner),
+        name,
+        hashlib.md5(arguments).hexdigest()
+    )
+
+    result = cache.get(key)
+    if result is not None:
+        _count('hits')
+        return result
+
+    _count('misses')
+    result = func(*args, **kwargs)
+    cache.set(
+        key, result, getattr(settings, 'CART_CACHE_TIMEOUT', 600))
+
+    return result
+
+
+IDEMPOTENCY_PENDING = 'pending'
+
+
+def _idempotency_key(owner, key):
+    return 'cart:idempotency:{}:{}'.format(
+        owner, hashlib.md5(force_bytes(key)).hexdigest())
+
+
+def claim_idempotency_key(owner, key):
+    """Mark the request with the key as pending
+
+    Returns:
+        bool: False if the key is used already
+
+    """
+    return get_cache().add(
+        _idempotency_key(owner, key),
+        IDEMPOTENCY_PENDING,
+        getattr(settings, 'CART_IDEMPOTENCY_TIMEOUT', 3600)
+    )
+
+
+def get_idempotency_result(owner, key):
+    """Result of the request with the key, IDEMPOTENCY_PENDING if it is not
+    finished yet, None if the key is unknown
+
+    """
+    return get_cache().get(_idempotency_key(owner, key))
+
+
+def set_idempotency_result(owner, key, result):
+    get_cache().set(
+        _idempotency_key(owner, key),
+        result,
+        getattr(settings, 'CART_IDEMPOTENCY_TIMEOUT', 3600)
+    )
+
+
+def release_idempotency_key(owner, key):
+    get_cache().delete(_idempotency_key(owner, key))
+
+
+@contextmanager
+def owner_lock(owner):
+    """Lock of the cart of the owner shared by all processes
+
+    The lock is a cache key added with `cache.add`, it expires after
+    `CART_LOCK_TIMEOUT` seconds (10 by default) if its holder dies. If the
+    lock isn't taken in that time, the block runs without it.
+
+    Yields:
+        bool: the lock is taken
+
+    """
+    cache = get_cache()
+    key = 'cart:lock:{}'.format(owner)
+    timeout = getattr(settings, 'CART_LOCK_TIMEOUT', 10)
+    deadline = time.time() + timeout
+
+    locked = cache.add(key, 1, timeout)
+    while not locked and time.time() < deadline:
+        time.sleep(0.05)
+        locked = cache.add(key, 1, timeout)
+
+    try:
+        yield locked
+    finally:
+        if locked:
+            cache.delete(key)
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_stats():
+    """Hit and miss counters of the current process"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
@@ -0,0 +1,198 @@
+"""Garbage collection of cart items nobody is going to pay for
+
+Orphaned items lost their session: `clearsessions` removes expired sessions
+and `CartItem.session` is set to NULL, the stale session key stays. Abandoned
+items belong to user carts which were not changed for `CART_ABANDONED_DAYS`
+days (30 by default).
+
+Items are walked in chunks ordered by id (keyset pagination, there is no
+OFFSET to scan), reservations are released with one call per cart and
+products are deleted with one query per product model. Pause between chunks
+with `sleep` to keep the load of the live site low, `dry_run` only reports
+what would be removed.
+
+Summaries of removed sessions are deleted too, with one query per chunk.
+
+"""
+import logging
+import time
+from collections import Counter, OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+from . import cache as cart_cache
+from .models import (
+    CartItem, CartSummary, outbox_transaction, remove_products)
+from .utils import keyset_chunks
+
+
+logger = logging.getLogger("private-project.{}".format(__name__))
+
+
+def get_abandoned_age():
+    return timedelta(days=getattr(settings, 'CART_ABANDONED_DAYS', 30))
+
+
+def get_orphaned_items():
+    """Unpaid items whose session was removed"""
+    return CartItem.objects.filter(
+        is_paid=False, user__isnull=True, session__isnull=True)
+
+
+def get_abandoned_items(age=None):
+    """Unpaid items of user carts not changed for `age`"""
+    cutoff = timezone.now() - (age or get_abandoned_age())
+    active_user_ids = CartItem.objects.filter(
+        is_paid=False, user__isnull=False, modified__gte=cutoff
+    ).values('user_id')
+    return CartItem.objects.filter(
+        is_paid=False, user__isnull=False, modified__lt=cutoff
+    ).exclude(user_id__in=active_user_ids)
+
+
+def get_orphaned_summaries():
+    """Summaries of removed sessions which have no unpaid items left"""
+    return CartSummary.objects.filter(
+        user__isnull=True, session_key__isnull=False
+    ).exclude(
+        session_key__in=Session.objects.values('session_key')
+    ).exclude(
+        session_key__in=CartItem.objects.filter(
+            is_paid=False, session_key__isnull=False
+        ).values('session_key')
+    )
+
+
+def collect_summaries(queryset, chunk_size=500, sleep=0, dry_run=False):
+    """Delete summaries of the queryset chunk by chunk
+
+    Returns:
+        int: number of deleted summaries
+
+    """
+    count = 0
+    for chunk in keyset_chunks(queryset, chunk_size, 'id'):
+        if not dry_run:
+            CartSummary.objects.filter(
+                pk__in=[summary_id for summary_id, in chunk]).delete()
+        count += len(chunk)
+
+        if sleep:
+            time.sleep(sleep)
+
+    return count
+
+
+def group_by_owner(chunk):
+    owners = OrderedDict()
+    for item in chunk:
+        owners.setdefault((item[3], item[4]), []).append(item)
+    return owners
+
+
+def remove_cart_items(user, session_key, items, batch_size):
+    """Release and delete products of one cart, then delete its items"""
+    if user:
+        tempitura_session_key = user.tempitura_session_key
+        owner_key = cart_cache.owner_key(user_id=user.pk)
+    elif session_key:
+        from accounts.models import AnonymousUser
+        tempitura_session_key = AnonymousUser(
+            session_key).tempitura_session_key
+        owner_key = cart_cache.owner_key(session_key=session_key)
+    else:
+        # there is no session to release the products in
+        tempitura_session_key = None
+        owner_key = None
+
+    with outbox_transaction():
+        remove_products(
+            tempitura_session_key,
+            [(content_type_id, object_id)
+             for _, content_type_id, object_id, _, _ in items],
+            release=tempitura_session_key is not None,
+            batch_size=batch_size,
+            owner_key=owner_key
+        )
+        CartItem.objects.filter(pk__in=[item[0] for item in items]).delete()
+
+    if user:
+        CartSummary.objects.rebuild(user_id=user.pk)
+        cart_cache.bump_version(owner_key)
+    elif session_key:
+        CartSummary.objects.filter(session_key=session_key).delete()
+
+
+def collect(queryset, chunk_size=500, batch_size=50, sleep=0,
+            dry_run=False):
+    """Remove cart items of the queryset chunk by chunk
+
+    Args:
+        chunk_size (int): number of items read at once
+        batch_size (int): max number of tickets released by one
+            Tempitura call
+        sleep (float): seconds to wait after every chunk
+        dry_run (bool): only count the items
+
+    Returns:
+        dict: number of 'items', 'carts' and 'failed' carts, 'models' is
+            Counter of items per product model name
+
+    """
+    report = {'items': 0, 'carts': 0, 'failed': 0, 'models': Counter()}
+    chunks = keyset_chunks(
+        queryset, chunk_size,
+        'id', 'content_type_id', 'object_id', 'user_id', 'session_key')
+    for chunk in chunks:
+        owners = group_by_owner(chunk)
+        users = get_user_model().objects.in_bulk(
+            [user_id for user_id, _ in owners if user_id])
+
+        for (user_id, session_key), items in owners.items():
+            if not dry_run:
+                try:
+                    remove_cart_items(
+                        users.get(user_id), session_key, items, batch_size)
+                except Exception:
+                    logger.exception(
+                        "Cart items can't be removed: user %s, session %s",
+                        user_id, session_key)
+                    report['failed'] += 1
+                    continue
+
+            report['carts'] += 1
+            report['items'] += len(items)
+            for _, content_type_id, _, _, _ in items:
+                report['models'][ContentType.objects.get_for_id(
+                    content_type_id).model] += 1
+
+        if sleep:
+            time.sleep(sleep)
+
+    return report
+
+
+def collect_garbage(age=None, chunk_size=500, batch_size=50, sleep=0,
+                    dry_run=False):
+    """Remove orphaned items, abandoned user carts and summaries of removed
+    sessions
+
+    Returns:
+        dict: {'orphaned': report, 'abandoned': report, 'summaries': int},
+            see `collect` and `collect_summaries`
+
+    """
+    return OrderedDict((
+        ('orphaned', collect(
+            get_orphaned_items(), chunk_size, batch_size, sleep, dry_run)),
+        ('abandoned', collect(
+            get_abandoned_items(age), chunk_size, batch_size, sleep,
+            dry_run)),
+        ('summaries', collect_summaries(
+            get_orphaned_summaries(), chunk_size, sleep, dry_run)),
+    ))
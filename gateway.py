@@ -0,0 +1,130 @@
+"""Gateway of the Tempitura calls made by the cart app
+
+`CartGateway` wraps the `tempitura.api` functions used by the cart:
+
+* every call runs in the calling thread through the transport of
+  cart.transport, its sockets time out after `CART_TEMPITURA_TIMEOUT` seconds
+  and `RemoteTimeout` is raised then. Independent calls are made concurrent
+  with `call_concurrently` by the callers;
+* concurrent identical reads (`get_cart`, `get_ticket_expiration`) of one
+  Tempitura session share one in-flight call, e.g. when a user opens the
+  cart in several tabs;
+* calls are measured as 'remote' operations.
+
+Set `CART_TEMPITURA_URL` to make the calls over keep-alive HTTP connections
+instead of the `tempitura.api` client, see `HTTPTransport`.
+
+"""
+import logging
+import sys
+import threading
+
+from django.conf import settings
+from django.utils import six
+
+from .instrumentation import measure
+from .remote import RemoteTimeout
+from .transport import get_transport
+
+
+logger = logging.getLogger("private-project.{}".format(__name__))
+
+
+class _Flight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+    def get(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise RemoteTimeout(self)
+        if self.exc_info:
+            six.reraise(*self.exc_info)
+        return self.result
+
+
+class SingleFlight(object):
+    """Concurrent calls with the same key share the call of the first one"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """Call `func` or wait for the call in flight with the same key
+
+        Args:
+            key: hashable identity of the call
+            timeout (float): max time to wait for the call in flight, it is
+                taken from kwargs
+
+        """
+        timeout = kwargs.pop('timeout', None)
+        with self.lock:
+            flight = self.flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self.flights[key] = _Flight()
+
+        if not is_leader:
+            logger.debug("Joined call in flight: %s", key)
+            return flight.get(timeout)
+
+        try:
+            flight.result = func(*args, **kwargs)
+        except Exception:
+            flight.exc_info = sys.exc_info()
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+        return flight.get()
+
+
+class CartGateway(object):
+    def __init__(self, timeout=None, transport=None):
+        self.timeout = timeout
+        self._transport = transport
+        self.single_flight = SingleFlight()
+
+    @property
+    def transport(self):
+        if self._transport is None:
+            self._transport = get_transport()
+        return self._transport
+
+    def get_timeout(self):
+        if self.timeout is not None:
+            return self.timeout
+        return getattr(settings, 'CART_TEMPITURA_TIMEOUT', 10)
+
+    def call(self, name, *args, **kwargs):
+        """Call Tempitura in the current thread with the socket timeout"""
+        with measure('tempitura.{}'.format(name), 'remote'):
+            return self.transport.call(name, args, kwargs, self.get_timeout())
+
+    def coalesced_call(self, name, tempitura_session_key, **kwargs):
+        """Call of a read, identical calls in flight are shared"""
+        key = (name, tempitura_session_key, tuple(sorted(kwargs.items())))
+        return self.single_flight.do(
+            key, self.call, name, tempitura_session_key,
+            timeout=self.get_timeout(), **kwargs)
+
+    def get_cart(self, tempitura_session_key):
+        return self.coalesced_call('get_cart', tempitura_session_key)
+
+    def get_ticket_expiration(self, tempitura_session_key, as_utc=True):
+        return self.coalesced_call(
+            'get_ticket_expiration', tempitura_session_key, as_utc=as_utc)
+
+    def bulk_release_tickets(self, tempitura_session_key, ticket_data_list):
+        return self.call(
+            'bulk_release_tickets', tempitura_session_key, ticket_data_list)
+
+    def transfer_session(self, user):
+        return self.call('transfer_session', user)
+
+
+gateway = CartGateway()
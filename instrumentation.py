@@ -0,0 +1,182 @@
+"""Timing of cart operations
+
+Cart manager methods, cart views and Tempitura calls made by the app are
+measured when `CART_INSTRUMENTATION` setting is True. Every measured
+operation sends `operation_finished` signal with:
+
+    name: operation name, e.g. 'CartManager.new', 'tempitura.get_cart'
+    kind: 'manager', 'view' or 'remote'
+    duration: wall time in seconds
+    queries: number of database queries
+    query_time: time of database queries in seconds
+    error: exception raised by the operation or None
+
+`histogram` receives the signal and keeps the numbers in memory,
+`histogram.snapshot()` returns them in Prometheus text format.
+
+"""
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.dispatch import Signal
+
+
+operation_finished = Signal(
+    providing_args=['name', 'kind', 'duration', 'queries', 'query_time',
+                    'error'])
+
+
+def is_enabled():
+    return getattr(settings, 'CART_INSTRUMENTATION', False)
+
+
+def _start_query_log():
+    """Turn on query logging, returns state needed to count new queries"""
+    state = []
+    for connection in connections.all():
+        log = connection.queries_log
+        state.append((
+            connection,
+            connection.force_debug_cursor,
+            log[-1] if log else None,
+        ))
+        connection.force_debug_cursor = True
+    return state
+
+
+def _stop_query_log(state):
+    """Restore query logging, returns number and time of new queries"""
+    count = 0
+    query_time = 0.0
+    for connection, force_debug_cursor, last_query in state:
+        connection.force_debug_cursor = force_debug_cursor
+        # the log is limited, so compare with the last query seen before
+        # instead of the log length
+        for query in reversed(connection.queries_log):
+            if query is last_query:
+                break
+            count += 1
+            query_time += float(query['time'])
+    return count, query_time
+
+
+@contextmanager
+def measure(name, kind):
+    """Measure the code block and send `operation_finished`"""
+    if not is_enabled():
+        yield
+        return
+
+    state = _start_query_log()
+    started = time.time()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        duration = time.time() - started
+        queries, query_time = _stop_query_log(state)
+        operation_finished.send(
+            sender=None,
+            name=name,
+            kind=kind,
+            duration=duration,
+            queries=queries,
+            query_time=query_time,
+            error=error,
+        )
+
+
+def instrumented(name, kind):
+    """Decorator which measures every call of the function"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with measure(name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrumented_remote(func):
+    """Wrap Tempitura api function, so its calls are measured"""
+    name = 'tempitura.{}'.format(getattr(func, '__name__', 'call'))
+
+    def wrapper(*args, **kwargs):
+        with measure(name, 'remote'):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class Histogram(object):
+    """In-process aggregation of measured operations"""
+
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.data = {}
+
+    def __call__(self, sender, name, kind, duration, queries, query_time,
+                 error=None, **kwargs):
+        with self.lock:
+            data = self.data.setdefault((name, kind), {
+                'buckets': [0] * len(self.buckets),
+                'count': 0,
+                'sum': 0.0,
+                'errors': 0,
+                'queries': 0,
+                'query_time': 0.0,
+            })
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    data['buckets'][i] += 1
+            data['count'] += 1
+            data['sum'] += duration
+            data['errors'] += int(error is not None)
+            data['queries'] += queries
+            data['query_time'] += query_time
+
+    def snapshot(self):
+        """Prometheus text exposition of the collected numbers"""
+        with self.lock:
+            items = sorted(self.data.items())
+
+        lines = ['# TYPE cart_operation_seconds histogram']
+        for (name, kind), data in items:
+            labels = 'name="{}",kind="{}"'.format(name, kind)
+            for bound, count in zip(self.buckets, data['buckets']):
+                lines.append('cart_operation_seconds_bucket{{{},le="{}"}} {}'
+                             .format(labels, bound, count))
+            lines.append('cart_operation_seconds_bucket{{{},le="+Inf"}} {}'
+                         .format(labels, data['count']))
+            lines.append('cart_operation_seconds_sum{{{}}} {}'
+                         .format(labels, data['sum']))
+            lines.append('cart_operation_seconds_count{{{}}} {}'
+                         .format(labels, data['count']))
+
+        for metric, key, metric_type in (
+                ('cart_operation_errors_total', 'errors', 'counter'),
+                ('cart_operation_queries_total', 'queries', 'counter'),
+                ('cart_operation_query_seconds_total', 'query_time',
+                 'counter')):
+            lines.append('# TYPE {} {}'.format(metric, metric_type))
+            for (name, kind), data in items:
+                lines.append('{}{{name="{}",kind="{}"}} {}'.format(
+                    metric, name, kind, data[key]))
+
+        return '\n'.join(lines) + '\n'
+
+
+histogram = Histogram()
+operation_finished.connect(histogram, dispatch_uid='cart.histogram')
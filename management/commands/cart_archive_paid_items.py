@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from cart import archive
+
+
+class Command(BaseCommand):
+    help = "Move paid cart items to the archive table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help="Number of items moved by one transaction")
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help="Seconds to wait after every chunk")
+
+    def handle(self, *args, **options):
+        moved = archive.backfill(options['chunk_size'], options['sleep'])
+        self.stdout.write("{} paid cart items archived".format(moved))
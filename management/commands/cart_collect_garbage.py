@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from cart import cleanup
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove orphaned cart items, abandoned user carts and summaries of "
+        "removed sessions"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help="Age of abandoned carts, CART_ABANDONED_DAYS by default")
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help="Number of cart items read at once")
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help="Number of tickets released by one Tempitura call")
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help="Seconds to wait after every chunk")
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help="Only report what would be removed")
+
+    def handle(self, *args, **options):
+        age = None
+        if options['days'] is not None:
+            age = timedelta(days=options['days'])
+
+        reports = cleanup.collect_garbage(
+            age,
+            options['chunk_size'],
+            options['batch_size'],
+            options['sleep'],
+            options['dry_run'],
+        )
+
+        verb = "would be removed" if options['dry_run'] else "removed"
+        summaries = reports.pop('summaries')
+        for name, report in reports.items():
+            self.stdout.write(
+                "{}: {} items of {} carts {}, {} carts failed".format(
+                    name.capitalize(), report['items'], report['carts'],
+                    verb, report['failed']))
+            for model_name, count in sorted(report['models'].items()):
+                self.stdout.write("  {}: {}".format(model_name, count))
+        self.stdout.write(
+            "Summaries of removed sessions: {} {}".format(summaries, verb))
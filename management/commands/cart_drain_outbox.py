@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from cart import outbox
+
+
+class Command(BaseCommand):
+    help = "Do Tempitura operations saved in the cart outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true', default=False,
+            help="Keep draining, wait --interval seconds when it is empty")
+        parser.add_argument('--interval', type=int, default=5)
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help="Number of operations claimed at once")
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help="Number of Tempitura sessions processed concurrently")
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            outbox.run(
+                options['interval'],
+                options['batch_size'],
+                options['workers'],
+            )
+        else:
+            processed = outbox.drain(
+                options['batch_size'], options['workers'])
+            self.stdout.write("{} operations processed".format(processed))
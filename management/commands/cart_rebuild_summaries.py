@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from cart.models import CartSummary
+
+
+class Command(BaseCommand):
+    help = "Recalculate cart summaries from cart items"
+
+    def handle(self, *args, **options):
+        rebuilt = CartSummary.objects.rebuild_all()
+        self.stdout.write("{} cart summaries rebuilt".format(rebuilt))
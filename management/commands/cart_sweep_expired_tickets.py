@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from cart import sweeper
+
+
+class Command(BaseCommand):
+    help = "Release and remove expired tickets from shopping carts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true', default=False,
+            help="Keep sweeping every --interval seconds")
+        parser.add_argument('--interval', type=int, default=60)
+        parser.add_argument(
+            '--chunk-size', type=int, default=100,
+            help="Number of carts checked at once")
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help="Number of tickets released by one Tempitura call")
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            sweeper.run(
+                options['interval'],
+                options['chunk_size'],
+                options['batch_size'],
+            )
+        else:
+            removed = sweeper.sweep(
+                options['chunk_size'], options['batch_size'])
+            self.stdout.write(
+                "Expired tickets removed from {} carts".format(removed))
@@ -1,8 +1,28 @@
 # -*- coding: utf-8 -*-
+import time
 
+from django.conf import settings
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
 from django.contrib.sessions.models import Session
 
+from . import routers
+
+
+def get_session_cart_items(session_key):
+    """Cart manager of the anonymous session
+
+    Session object is fetched only here, so requests which never touch the
+    cart don't pay for the query.
+
+    """
+    session_obj = Session.objects.get(
+        session_key=session_key,
+        expire_date__gt=timezone.now()
+    )
+    return session_obj.cart_items
+
 
 class AnonymousCart(object):
     def process_request(self, request):
@@ -10,24 +30,49 @@ class AnonymousCart(object):
         similar as logged in user does
 
         """
-        session_obj = Session.objects.get(
-            session_key=request.session.session_key,
-            expire_date__gt=timezone.now()
-        )
         if request.user.is_authenticated():
             return
 
+        session_key = request.session.session_key
+
         # session will be removed when user log in, but we save anonymous
         # session key in order to find cart items that were associated with the
-        # removed session
-        request.session['anonymous_session_key'] = request.session.session_key
+        # removed session. Don't touch the session if the key is already there,
+        # otherwise it is saved again on every request.
+        if request.session.get('anonymous_session_key') != session_key:
+            request.session['anonymous_session_key'] = session_key
 
-        session_obj = Session.objects.get(
-            session_key=request.session.session_key,
-            expire_date__gt=timezone.now()
-        )
+        # Cart kept outside of the database, see cart.storage
+        storage = getattr(settings, 'CART_ANONYMOUS_STORAGE', None)
+        if storage:
+            request.user.cart_items = import_string(storage)(request.session)
+            return
 
         # Anonymous user hasn't cart_items object (CartManager object), but
-        # session_obj has. Create cart_items property for anonymous user object
-        # with session_obj's cart items.
-        request.user.cart_items = session_obj.cart_items
+        # session_obj has. Create lazy cart_items property for anonymous user
+        # object, session_obj is resolved on first access and memoized for the
+        # rest of the request.
+        request.user.cart_items = SimpleLazyObject(
+            lambda: get_session_cart_items(session_key)
+        )
+
+
+class CartReplicaStickiness(object):
+    """Keep the owner on the primary database for a while after the cart is
+    changed, so the replica lag can't hide the change (see cart.routers)
+
+    It has to be placed after SessionMiddleware.
+
+    """
+    session_key = '_cart_primary_until'
+
+    def process_request(self, request):
+        until = request.session.get(self.session_key, 0)
+        routers.reset(pinned=until > time.time())
+
+    def process_response(self, request, response):
+        if routers.has_written() and hasattr(request, 'session'):
+            request.session[self.session_key] = (
+                time.time() + routers.get_sticky_seconds())
+        routers.reset()
+        return response
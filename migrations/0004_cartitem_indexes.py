@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+# PostgreSQL builds the indexes with CREATE INDEX CONCURRENTLY, so writes to
+# the cart table are not blocked while they are built. Partial indexes keep
+# paid items and items of logged in users out of the index there, other
+# databases get regular indexes.
+#
+# Django < 1.10 runs every migration in a transaction, where CONCURRENTLY is
+# not allowed. There the indexes are built with a lock, to avoid it create
+# them beforehand with the CONCURRENTLY statements below, the migration
+# skips existing indexes.
+PARTIAL_INDEXES = [
+    ('cart_cartitem_unpaid_user_id', '(user_id) WHERE NOT is_paid'),
+    ('cart_cartitem_session_key',
+     '(session_key) WHERE session_key IS NOT NULL'),
+    ('cart_cartitem_content_type_object_id', '(content_type_id, object_id)'),
+]
+
+INDEXES = [
+    ('cart_cartitem_unpaid_user_id', '(user_id, is_paid)'),
+    ('cart_cartitem_session_key', '(session_key)'),
+    ('cart_cartitem_content_type_object_id', '(content_type_id, object_id)'),
+]
+
+
+def is_postgresql(schema_editor):
+    return schema_editor.connection.vendor == 'postgresql'
+
+
+def can_run_concurrently(schema_editor):
+    return (
+        is_postgresql(schema_editor) and
+        not schema_editor.connection.in_atomic_block
+    )
+
+
+def create_indexes(apps, schema_editor):
+    if is_postgresql(schema_editor):
+        indexes = PARTIAL_INDEXES
+    else:
+        indexes = INDEXES
+
+    if can_run_concurrently(schema_editor):
+        statement = 'CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} {}'
+    elif schema_editor.connection.vendor == 'mysql':
+        # InnoDB builds indexes without blocking writes by itself
+        statement = 'CREATE INDEX {} ON {} {}'
+    else:
+        statement = 'CREATE INDEX IF NOT EXISTS {} ON {} {}'
+
+    for name, definition in indexes:
+        schema_editor.execute(
+            statement.format(name, 'cart_cartitem', definition))
+
+
+def drop_indexes(apps, schema_editor):
+    if can_run_concurrently(schema_editor):
+        statement = 'DROP INDEX CONCURRENTLY IF EXISTS {}'
+    elif schema_editor.connection.vendor == 'mysql':
+        statement = 'DROP INDEX {} ON cart_cartitem'
+    else:
+        statement = 'DROP INDEX IF EXISTS {}'
+
+    for name, _ in INDEXES:
+        schema_editor.execute(statement.format(name))
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('cart', '0003_cartitem_price_snapshot'),
+    ]
+
+    operations = [
+        # the index of index_together is created by create_indexes too
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterIndexTogether(
+                    name='cartitem',
+                    index_together=set([('content_type', 'object_id')]),
+                ),
+            ],
+        ),
+        migrations.RunPython(create_indexes, drop_indexes, atomic=False),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0004_cartitem_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxOperation',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, verbose_name='created', editable=False)),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, verbose_name='modified', editable=False)),
+                ('operation', models.CharField(max_length=32, choices=[('release_tickets', 'Release tickets'), ('delete_products', 'Delete products'), ('transfer_session', 'Transfer session')])),
+                ('tempitura_session_key', models.CharField(max_length=255)),
+                ('payload', models.TextField()),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('is_failed', models.BooleanField(default=False)),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='outboxoperation',
+            index_together=set([('is_failed', 'next_attempt_at')]),
+        ),
+    ]
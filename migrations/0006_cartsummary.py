@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cart', '0005_outboxoperation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartSummary',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('session_key', models.CharField(max_length=255, unique=True, null=True, blank=True)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('subtotal', models.FloatField(default=0.0)),
+                ('content_types', models.CharField(default=',', max_length=255)),
+                ('expires_at', models.DateTimeField(null=True, blank=True)),
+                ('user', models.OneToOneField(related_name='cart_summary', null=True, blank=True, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contenttypes', '0001_initial'),
+        ('cart', '0006_cartsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaidCartItem',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('cart_item_id', models.PositiveIntegerField(unique=True)),
+                ('object_id', models.PositiveIntegerField()),
+                ('session_key', models.CharField(max_length=255, null=True, blank=True)),
+                ('price', models.FloatField(null=True, blank=True)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('created', models.DateTimeField()),
+                ('paid_at', models.DateTimeField(default=django.utils.timezone.now, db_index=True)),
+                ('content_type', models.ForeignKey(to='contenttypes.ContentType')),
+                ('user', models.ForeignKey(related_name='paid_cart_items', blank=True, to=settings.AUTH_USER_MODEL, null=True)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='paidcartitem',
+            index_together=set([('content_type', 'object_id')]),
+        ),
+    ]
@@ -1,2 +1,4 @@
 from .cart import *
 from .product import *
+from .outbox import *
+from .archive import *
@@ -0,0 +1,47 @@
+from django.db import models
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.utils import timezone
+
+
+def is_archive_enabled():
+    return getattr(settings, 'CART_ARCHIVE_ON_PAY', False)
+
+
+class PaidCartItem(models.Model):
+    """Paid cart item moved out of the cart table
+
+    The cart table keeps only live carts. Items are moved here by
+    `CartManager.set_as_paid` when `CART_ARCHIVE_ON_PAY` is on and by the
+    `cart_archive_paid_items` command.
+
+    """
+    # id of the original CartItem
+    cart_item_id = models.PositiveIntegerField(unique=True)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    product = GenericForeignKey()
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="paid_cart_items",
+        null=True,
+        blank=True
+    )
+    session_key = models.CharField(max_length=255, null=True, blank=True)
+    price = models.FloatField(null=True, blank=True)
+    quantity = models.PositiveIntegerField(default=1)
+    # when the item was added to the cart
+    created = models.DateTimeField()
+    paid_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        index_together = [
+            ('content_type', 'object_id'),
+        ]
+
+    def __str__(self):
+        if not self.product:
+            return "Removed item"
+
+        return self.product.get_title()
@@ -1,22 +1,419 @@
 import logging
-from django.db import models
+import sys
+from collections import OrderedDict, namedtuple
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Concat
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.sessions.models import Session
 from django.core.exceptions import ValidationError
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
+from django.utils import six, timezone
 
 from model_utils.models import TimeStampedModel
 
-from tempitura import api
-from tempitura.utils import remove_expired_tickets
-from accounts.models import AnonymousUser
+from .. import cache as cart_cache
+from .. import routers
+from ..gateway import gateway
+from ..instrumentation import instrumented, measure
+from ..remote import RemoteTimeout
+from ..utils import chunks
+from .archive import PaidCartItem, is_archive_enabled
+from .outbox import OutboxOperation, is_outbox_enabled, outbox_transaction
 
 
 logger = logging.getLogger("private-project.{}".format(__name__))
 
 
+class RequestInProgress(Exception):
+    """Request with the same idempotency key is not finished yet"""
+
+
+# read-only line of a cart list, see CartManager.lines
+CartLine = namedtuple('CartLine', 'id title cost type expiry')
+
+
+def load_products(items):
+    """Load products of cart items with one query per product model
+
+    Args:
+        items: iterable of (content_type_id, object_id) pairs
+
+    Returns:
+        OrderedDict: {model: [product, ...]}
+
+    """
+    ids_map = OrderedDict()
+    for content_type_id, object_id in items:
+        ids_map.setdefault(content_type_id, []).append(object_id)
+
+    products = OrderedDict()
+    for content_type_id, ids in ids_map.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is None:
+            # model was removed from the project
+            continue
+        products[model] = list(model._default_manager.filter(pk__in=ids))
+
+    return products
+
+
+def attach_products(items):
+    """Load products of cart items and attach them to the items
+
+    Products are loaded with one query per product model, related objects
+    declared by the model in `cart_select_related` and
+    `cart_prefetch_related` are loaded with them. Removed products are
+    attached as None.
+
+    """
+    ids_map = OrderedDict()
+    for item in items:
+        ids_map.setdefault(item.content_type_id, set()).add(item.object_id)
+
+    products = {}
+    for content_type_id, ids in ids_map.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is None:
+            # model was removed from the project
+            continue
+        for product in model.get_cart_queryset().filter(pk__in=ids):
+            products[content_type_id, product.pk] = product
+
+    for item in items:
+        setattr(item, CartItem.product.cache_attr, products.get(
+            (item.content_type_id, item.object_id)))
+
+
+def build_cart_lines(rows):
+    """Build CartLine objects with one `get_cart_lines` call per product model
+
+    Cost of a line is its price snapshot times quantity, product cost is used
+    for items without snapshot.
+
+    Args:
+        rows: list of (id, content_type_id, object_id, price, quantity)
+
+    Returns:
+        list of CartLine objects
+
+    """
+    ids_map = OrderedDict()
+    for _, content_type_id, object_id, _, _ in rows:
+        ids_map.setdefault(content_type_id, set()).add(object_id)
+
+    data, types = {}, {}
+    for content_type_id, ids in ids_map.items():
+        content_type = ContentType.objects.get_for_id(content_type_id)
+        types[content_type_id] = content_type.model
+        model = content_type.model_class()
+        if model is None:
+            # model was removed from the project
+            continue
+        for pk, values in model.get_cart_lines(ids).items():
+            data[content_type_id, pk] = values
+
+    lines = []
+    for item_id, content_type_id, object_id, price, quantity in rows:
+        title, cost, expiry = data.get(
+            (content_type_id, object_id), ("Removed item", 0.0, None))
+        if price is not None:
+            cost = price * quantity
+        lines.append(CartLine(
+            item_id, title, cost, types[content_type_id], expiry))
+    return lines
+
+
+def release_tickets(tempitura_session_key, ticket_ids, batch_size=None,
+                    owner_key=None):
+    """Release tickets in Tempitura and delete them
+
+    The release is left to the outbox worker when the outbox is turned on.
+
+    Errors of a batch are logged, the other batches are released anyway.
+
+    Args:
+        batch_size (int): max number of tickets released by one
+            Tempitura call, all tickets are released at once by default
+        owner_key (str): cart owner, see `cache.owner_key`. Cached lookups
+            of the cart are invalidated when the outbox worker is done
+
+    """
+    from tempitura import api
+    from tickets.models import Ticket
+    ticket_qs = Ticket.objects.filter(id__in=ticket_ids)
+
+    ticket_data_list = list(
+        Ticket.objects.filter(
+            id__in=ticket_ids
+        ).values_list('performance__tempitura_no', 'li_seq_no')
+    )
+
+    if is_outbox_enabled():
+        if ticket_data_list:
+            OutboxOperation.objects.enqueue(
+                OutboxOperation.RELEASE_TICKETS,
+                tempitura_session_key,
+                tickets=ticket_data_list,
+                owner_key=owner_key
+            )
+        ticket_qs.delete()
+        return
+
+    try:
+        for batch in chunks(ticket_data_list, batch_size):
+            # a failed batch doesn't stop the release of the next ones
+            try:
+                gateway.bulk_release_tickets(tempitura_session_key, batch)
+            except (api.APIError, RemoteTimeout):
+                # TODO: maybe we should call transfer session?
+                logger.exception(
+                    'Tickets remove error! Tempitura key %s, tickets %s',
+                    tempitura_session_key, batch)
+    finally:
+        ticket_qs.delete()
+
+
+def delete_products(items):
+    """Delete products with one query per product model
+
+    Args:
+        items: iterable of (content_type_id, object_id) pairs
+
+    """
+    ids_map = OrderedDict()
+    for content_type_id, object_id in items:
+        ids_map.setdefault(content_type_id, []).append(object_id)
+
+    for content_type_id, ids in ids_map.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is not None:
+            model._default_manager.filter(pk__in=ids).delete()
+
+
+def remove_products(tempitura_session_key, items, release=True,
+                    batch_size=None, owner_key=None):
+    """Release and delete products of cart items
+
+    Tickets are released with one `bulk_release_tickets` call, other products
+    with one `delete_callback_many` call per model. Release errors are logged,
+    products are deleted anyway.
+
+    Args:
+        items: list of (content_type_id, object_id) pairs
+        release (bool): release products in Tempitura
+        batch_size (int): max number of tickets released by one
+            Tempitura call, all tickets are released at once by default
+        owner_key (str): cart owner, see `release_tickets`
+
+    """
+    from tempitura import api
+    from tickets.models import Ticket
+
+    if not release:
+        delete_products(items)
+        return
+
+    ticket_content_type_id = ContentType.objects.get_for_model(Ticket).pk
+    ticket_ids = [
+        object_id for content_type_id, object_id in items
+        if content_type_id == ticket_content_type_id
+    ]
+    other_items = [
+        item for item in items if item[0] != ticket_content_type_id
+    ]
+
+    if ticket_ids:
+        release_tickets(
+            tempitura_session_key, ticket_ids, batch_size, owner_key)
+
+    if not other_items:
+        return
+
+    if is_outbox_enabled():
+        # products are released and deleted by the outbox worker
+        OutboxOperation.objects.enqueue(
+            OutboxOperation.DELETE_PRODUCTS,
+            tempitura_session_key,
+            products=other_items,
+            owner_key=owner_key
+        )
+        return
+
+    try:
+        for model, objects in load_products(other_items).items():
+            with measure('tempitura.delete_callback_many', 'remote'):
+                model.delete_callback_many(tempitura_session_key, objects)
+    except api.APIError:
+        logger.exception('Products remove error!')
+    finally:
+        delete_products(other_items)
+
+
+def archive_cart_items(cart_item_qs, paid_at=None):
+    """Move cart items to PaidCartItem
+
+    Args:
+        paid_at (datetime): time of the payment, last change of the item by
+            default
+
+    Returns:
+        int: number of moved items
+
+    """
+    rows = list(cart_item_qs.values_list(
+        'id', 'content_type_id', 'object_id', 'user_id', 'session_key',
+        'price', 'quantity', 'created', 'modified'))
+    if not rows:
+        return 0
+
+    PaidCartItem.objects.bulk_create([
+        PaidCartItem(
+            cart_item_id=item_id,
+            content_type_id=content_type_id,
+            object_id=object_id,
+            user_id=user_id,
+            session_key=session_key,
+            price=price,
+            quantity=quantity,
+            created=created,
+            paid_at=paid_at or modified,
+        )
+        for (item_id, content_type_id, object_id, user_id, session_key,
+             price, quantity, created, modified) in rows
+    ])
+    CartItem.objects.filter(pk__in=[row[0] for row in rows]).delete()
+    return len(rows)
+
+
+def add_idempotently(owner, idempotency_key, product, add, get_item):
+    """Add product with `add()` once per idempotency key of the owner
+
+    A repeated request gets the cart item added by the first one and its own
+    product is deleted, nothing is reserved in Tempitura.
+
+    Args:
+        owner (str): cache identifier of the cart owner
+        add: function which adds the product and returns the cart item
+        get_item: function which returns the cart item by id or None
+
+    Raises:
+        RequestInProgress: the first request is not finished yet, the
+            product is deleted the same as on `api.TaskIsPending`
+
+    """
+    while not cart_cache.claim_idempotency_key(owner, idempotency_key):
+        result = cart_cache.get_idempotency_result(owner, idempotency_key)
+        if result == cart_cache.IDEMPOTENCY_PENDING:
+            product.delete()
+            raise RequestInProgress(idempotency_key)
+
+        item = get_item(result) if result is not None else None
+        if item is not None:
+            if (item.content_type_id, item.object_id) != (
+                    ContentType.objects.get_for_model(product).pk,
+                    product.pk):
+                product.delete()
+            return item
+
+        # the item was removed or the key expired meanwhile
+        cart_cache.release_idempotency_key(owner, idempotency_key)
+
+    try:
+        item = add()
+    except Exception:
+        exc_info = sys.exc_info()
+        cart_cache.release_idempotency_key(owner, idempotency_key)
+        six.reraise(*exc_info)
+
+    cart_cache.set_idempotency_result(owner, idempotency_key, item.pk)
+    return item
+
+
+def group_by_model(products):
+    """Group products by their model
+
+    Returns:
+        OrderedDict: {model: [product, ...]}
+
+    """
+    groups = OrderedDict()
+    for product in products:
+        groups.setdefault(type(product), []).append(product)
+    return groups
+
+
+def release_products(tempitura_session_key, products):
+    """Cancel reservation of products, errors are logged"""
+    for model, objects in group_by_model(products).items():
+        try:
+            with measure('tempitura.delete_callback_many', 'remote'):
+                model.delete_callback_many(tempitura_session_key, objects)
+        except Exception:
+            logger.exception('Products release error!')
+
+
+def check_expired_tickets(cart_items, tempitura_session_key):
+    """Remove expired tickets of the cart before products are added to it
+
+    Expired tickets can be removed by the sweeper instead (see cart.sweeper),
+    then the check is turned off with `CART_INLINE_EXPIRY_CHECK = False`.
+
+    """
+    if getattr(settings, 'CART_INLINE_EXPIRY_CHECK', True):
+        from tempitura.utils import remove_expired_tickets
+        with measure('tempitura.remove_expired_tickets', 'remote'):
+            remove_expired_tickets(cart_items, tempitura_session_key)
+
+
+def reserve_product(tempitura_session_key, product, **kwargs):
+    """Reserve product with `add_to_cart_callback`
+
+    Product is deleted if Tempitura task is pending.
+
+    """
+    from tempitura import api
+    try:
+        with measure('tempitura.add_to_cart_callback', 'remote'):
+            product.add_to_cart_callback(tempitura_session_key, **kwargs)
+    except api.TaskIsPending:
+        # to prevent extra the same products in the
+        # private-project shopping cart when we use celery
+        product.delete()
+        raise
+
+
+def reserve_products(tempitura_session_key, products, **kwargs):
+    """Reserve products with one `add_to_cart_callback_many` call per model
+
+    If any model fails, products reserved before it are released, the
+    failing model releases its own ones (see
+    `ProductMixin.add_to_cart_callback_many`). All products are deleted if
+    Tempitura task is pending, the same as `CartManager.new` does.
+
+    """
+    from tempitura import api
+    reserved = []
+    try:
+        for model, objects in group_by_model(products).items():
+            with measure('tempitura.add_to_cart_callback_many', 'remote'):
+                model.add_to_cart_callback_many(
+                    tempitura_session_key, objects, **kwargs)
+            reserved.extend(objects)
+    except Exception:
+        exc_info = sys.exc_info()
+        release_products(tempitura_session_key, reserved)
+        if isinstance(exc_info[1], api.TaskIsPending):
+            # to prevent extra the same products in the
+            # private-project shopping cart when we use celery
+            for product in products:
+                product.delete()
+        six.reraise(*exc_info)
+
+
 class CartManager(models.Manager):
     use_for_related_fields = True
 
@@ -26,10 +423,34 @@ class CartManager(models.Manager):
             return self.instance
         # anonymous user
         elif isinstance(self.instance, Session):
+            from accounts.models import AnonymousUser
             return AnonymousUser(self.instance.session_key)
         else:
             raise Exception('Wrong owner object type')
 
+    @property
+    def tempitura_session_key(self):
+        return self.__get_owner().tempitura_session_key
+
+    def __get_owner_key(self):
+        if isinstance(self.instance, get_user_model()):
+            return cart_cache.owner_key(user_id=self.instance.pk)
+        return cart_cache.owner_key(session_key=self.instance.session_key)
+
+    def __get_summary_owner(self):
+        if isinstance(self.instance, get_user_model()):
+            return {'user_id': self.instance.pk}
+        return {'session_key': self.instance.session_key}
+
+    def touch(self):
+        """Mark the cart as changed, cached lookups are invalidated"""
+        cart_cache.bump_version(self.__get_owner_key())
+
+    def cached(self, name, func, *args, **kwargs):
+        """Call `func` or return its result cached for the current cart"""
+        return cart_cache.get_or_call(
+            self.__get_owner_key(), name, func, *args, **kwargs)
+
     def get_queryset(self):
         """Returns unpaid items if instance is User"""
         filter_items = {}
@@ -38,67 +459,267 @@ class CartManager(models.Manager):
 
         return super(CartManager, self).get_queryset().filter(**filter_items)
 
-    def set_as_paid(self):
-        """All unpaid items set as paid"""
-        for item in self.get_queryset().prefetch_related('product'):
-            item.product.checkout_callback()
+    @instrumented('CartManager.set_as_paid', 'manager')
+    @routers.on_primary
+    def set_as_paid(self, session_key=None):
+        """All unpaid items set as paid
 
-        return self.get_queryset().update(is_paid=True)
-
-    def new(self, product, **kwargs):
-        """Add any item to the shopping cart
-
-        Can't use `add` name, it used by RelatedManager
-        here django/db/models/fields/related
+        Products are checked out per model with
+        `ProductMixin.checkout_callback_many`, then exactly the checked out
+        items are marked as paid, or moved to PaidCartItem when
+        `CART_ARCHIVE_ON_PAY` is on. Items are locked until the transaction
+        ends, so items added meanwhile stay unpaid.
 
         Args:
-            product (object): model object based on ProductMixin model
+            session_key (str): anonymous cart paid by the model manager,
+                `CartItem.cart_manager.set_as_paid(session_key)`, when the
+                session isn't kept in the database
 
         Returns:
-            CartItem object
+            int: number of items set as paid
 
         """
-        self.user = self.__get_owner()
+        if session_key is None:
+            summary_owner = self.__get_summary_owner()
+            owner_key = self.__get_owner_key()
+            cart_item_qs = self.get_queryset()
+        else:
+            summary_owner = {'session_key': session_key}
+            owner_key = cart_cache.owner_key(session_key=session_key)
+            cart_item_qs = CartItem.objects.filter(
+                session_key=session_key, is_paid=False)
 
+        with transaction.atomic():
+            items = list(
+                cart_item_qs.select_for_update().values_list(
+                    'id', 'content_type_id', 'object_id'))
+            if not items:
+                return 0
+
+            products = load_products(
+                (content_type_id, object_id)
+                for _, content_type_id, object_id in items
+            )
+            for model, objects in products.items():
+                model.checkout_callback_many(objects)
+
+            paid_item_qs = CartItem.objects.filter(
+                pk__in=[item_id for item_id, _, _ in items])
+            if is_archive_enabled():
+                count = archive_cart_items(paid_item_qs, timezone.now())
+            else:
+                count = paid_item_qs.update(is_paid=True)
+            CartSummary.objects.rebuild(**summary_owner)
+
+        cart_cache.bump_version(owner_key)
+        return count
+
+    def __get_owner_data(self):
         # associate cart item with user
         if isinstance(self.instance, get_user_model()):
-            owner_object_data = {'user': self.instance}
+            return {'user': self.instance}
         # associate cart item with session
         elif isinstance(self.instance, Session):
-            owner_object_data = {
+            return {
                 'session': self.instance,
                 'session_key': self.instance.session_key
             }
 
+    def get_by_idempotency_key(self, idempotency_key):
+        """Cart item added by the request with the key, None if there is no
+        one (yet)
+
+        """
+        result = cart_cache.get_idempotency_result(
+            self.__get_owner_key(), idempotency_key)
+        if result is None or result == cart_cache.IDEMPOTENCY_PENDING:
+            return None
+        return self.get_queryset().filter(pk=result).first()
+
+    @instrumented('CartManager.new', 'manager')
+    @routers.on_primary
+    def new(self, product, idempotency_key=None, **kwargs):
+        """Add any item to the shopping cart
+
+        Can't use `add` name, it used by RelatedManager
+        here django/db/models/fields/related
+
+        Args:
+            product (object): model object based on ProductMixin model
+            idempotency_key (str): key of the request (see
+                `cart.utils.get_idempotency_key`), a repeated request gets the
+                item added by the first one, see `add_idempotently`
+
+        Returns:
+            CartItem object
+
+        """
+        if idempotency_key:
+            return add_idempotently(
+                self.__get_owner_key(), idempotency_key, product,
+                lambda: self.__add(product, **kwargs),
+                lambda item_id: self.get_queryset().filter(pk=item_id).first()
+            )
+
+        return self.__add(product, **kwargs)
+
+    def __add(self, product, **kwargs):
+        self.user = self.__get_owner()
+        owner_object_data = self.__get_owner_data()
+
         tempitura_session_key = self.user.tempitura_session_key
 
         logger.debug("New cart item: tempitura key %s", tempitura_session_key)
 
-        remove_expired_tickets(self.instance.cart_items, tempitura_session_key)
-
-        try:
-            product.add_to_cart_callback(tempitura_session_key, **kwargs)
-        except api.TaskIsPending:
-            # to prevent extra the same products in the
-            # private-project shopping cart when we use celery
-            product.delete()
-            raise
+        check_expired_tickets(self.instance.cart_items, tempitura_session_key)
+        reserve_product(tempitura_session_key, product, **kwargs)
 
         item = self.model(product=product, **owner_object_data)
-        item.save()
+        item.set_snapshot(product)
+        with transaction.atomic():
+            item.save()
+            CartSummary.objects.add_items(
+                [item], **self.__get_summary_owner())
+        self.touch()
 
         return item
 
-    def transfer_to_user(self, session_key, user):
-        """Transfer all cart items to user"""
-        for cart_item in CartItem.objects.filter(session_key=session_key):
-            cart_item.user = user
-            cart_item.session = None
-            cart_item.session_key = None
-            cart_item.save()
+    @instrumented('CartManager.new_many', 'manager')
+    @routers.on_primary
+    def new_many(self, products, **kwargs):
+        """Add several items to the shopping cart at once
+
+        Products are reserved with one `add_to_cart_callback_many` call per
+        model and cart items are inserted with one query. Nothing is added if
+        any product fails, see `reserve_products`.
+
+        Args:
+            products (list): model objects based on ProductMixin model
+
+        Returns:
+            list of CartItem objects
+
+        """
+        products = list(products)
+        if not products:
+            return []
+
+        self.user = self.__get_owner()
+        owner_object_data = self.__get_owner_data()
+
+        tempitura_session_key = self.user.tempitura_session_key
+
+        logger.debug(
+            "New cart items: tempitura key %s, %d products",
+            tempitura_session_key, len(products))
+
+        check_expired_tickets(self.instance.cart_items, tempitura_session_key)
+        reserve_products(tempitura_session_key, products, **kwargs)
+
+        items = []
+        for product in products:
+            item = self.model(product=product, **owner_object_data)
+            item.set_snapshot(product)
+            items.append(item)
+
+        try:
+            with transaction.atomic():
+                self.model.objects.bulk_create(items)
+                CartSummary.objects.add_items(
+                    items, **self.__get_summary_owner())
+        except Exception:
+            exc_info = sys.exc_info()
+            release_products(tempitura_session_key, products)
+            six.reraise(*exc_info)
+
+        self.touch()
+
+        # bulk_create doesn't set primary keys
+        lookup = Q()
+        for model, objects in group_by_model(products).items():
+            lookup |= Q(
+                content_type=ContentType.objects.get_for_model(model),
+                object_id__in=[obj.pk for obj in objects]
+            )
+        return list(self.get_queryset().filter(lookup).order_by('id'))
+
+    @instrumented('CartManager.transfer_to_user', 'manager')
+    @routers.on_primary
+    def transfer_to_user(self, session_key, user, bulk=True):
+        """Transfer all cart items to user
+
+        In bulk mode cart items are moved with one UPDATE and products are
+        notified per model with `ProductMixin.transfer_to_user_many`.
+
+        """
+        if bulk:
+            self.__bulk_transfer_to_user(session_key, user)
+        else:
+            for cart_item in CartItem.objects.filter(session_key=session_key):
+                cart_item.user = user
+                cart_item.session = None
+                cart_item.session_key = None
+                cart_item.save()
+
+                cart_item.product.transfer_to_user(user)
+
+            transfer_summary(session_key, user.pk)
+
+        cart_cache.bump_version(cart_cache.owner_key(session_key=session_key))
+        cart_cache.bump_version(cart_cache.owner_key(user_id=user.pk))
 
-            cart_item.product.transfer_to_user(user)
+    def __bulk_transfer_to_user(self, session_key, user):
+        with transaction.atomic():
+            cart_item_qs = CartItem.objects.filter(session_key=session_key)
+            items = list(
+                cart_item_qs.values_list('content_type_id', 'object_id'))
+            if not items:
+                return
 
+            cart_item_qs.update(user=user, session=None, session_key=None)
+            transfer_summary(session_key, user.pk)
+
+            for model, products in load_products(items).items():
+                model.transfer_to_user_many(products, user)
+
+    @instrumented('CartManager.with_products', 'manager')
+    def with_products(self, cart_items=None):
+        """Cart items with their products, see `attach_products`
+
+        Rendering of the list costs the same number of queries whatever the
+        cart size is.
+
+        Args:
+            cart_items: queryset of the cart items, all items ordered by id
+                by default
+
+        Returns:
+            list of CartItem objects
+
+        """
+        if cart_items is None:
+            cart_items = self.get_queryset().order_by('id')
+        items = list(cart_items)
+        attach_products(items)
+        return items
+
+    @instrumented('CartManager.lines', 'manager')
+    def lines(self):
+        """Read-only lines of the cart ordered by id
+
+        Lines are built from values() queries without model instances, see
+        `build_cart_lines`.
+
+        Returns:
+            list of CartLine objects
+
+        """
+        return build_cart_lines(list(
+            self.get_queryset().order_by('id').values_list(
+                'id', 'content_type_id', 'object_id', 'price', 'quantity')
+        ))
+
+    @instrumented('CartManager.total_cost', 'manager')
     def total_cost(self):
         """Total cost of all unpaid items
 
@@ -106,14 +727,60 @@ class CartManager(models.Manager):
             float
 
         """
-        cost = 0.0
-        for item in self.get_queryset().prefetch_related('product'):
-            if item.product:
-                cost += item.product.get_cost()
+        return self.summary()['sub_total']
 
-        return cost
+    @instrumented('CartManager.summary', 'manager')
+    def summary(self):
+        """Count and cost of all unpaid items, they are read from the
+        CartSummary row of the owner
 
-    def remove_tickets(self):
+        Returns:
+            dict: {'count': int, 'sub_total': float}
+
+        """
+        summary = self.get_summary()
+        return {
+            'count': summary.item_count,
+            'sub_total': summary.subtotal,
+        }
+
+    def get_summary(self):
+        """CartSummary of the owner, it is built if there is no one yet
+
+        Empty cart without summary gets an unsaved one, so reading the cart
+        of a new visitor doesn't write to the database.
+
+        """
+        owner = self.__get_summary_owner()
+        summary = CartSummary.objects.filter(**owner).first()
+        if summary is None:
+            if not self.get_queryset().filter(is_paid=False).exists():
+                return CartSummary(**owner)
+            self.rebuild_summary()
+            summary = CartSummary.objects.get(**owner)
+        return summary
+
+    @routers.on_primary
+    def rebuild_summary(self):
+        """Recalculate CartSummary of the owner from its cart items"""
+        return CartSummary.objects.rebuild(**self.__get_summary_owner())
+
+    def set_expiration(self, expires_at):
+        """Save the reservation expiry reported by Tempitura to CartSummary"""
+        CartSummary.objects.filter(
+            **self.__get_summary_owner()
+        ).exclude(expires_at=expires_at).update(expires_at=expires_at)
+
+    @instrumented('CartManager.remove_tickets', 'manager')
+    @routers.on_primary
+    def remove_tickets(self, batch_size=None):
+        """Release and remove all tickets of the cart
+
+        Args:
+            batch_size (int): max number of tickets released by one
+                Tempitura call, all tickets are released at once by default
+
+        """
         from tickets.models import Ticket
         logger.debug("Remove all tickets")
         cart_item_qs = self.get_queryset().filter(
@@ -121,39 +788,69 @@ class CartManager(models.Manager):
         )
 
         ticket_ids = list(cart_item_qs.values_list('object_id', flat=True))
-        ticket_qs = Ticket.objects.filter(id__in=ticket_ids)
 
-        ticket_data_list = list(
-            Ticket.objects.filter(
-                id__in=ticket_ids
-            ).values_list('performance__tempitura_no', 'li_seq_no')
-        )
+        with outbox_transaction():
+            try:
+                release_tickets(
+                    self.tempitura_session_key, ticket_ids, batch_size,
+                    owner_key=self.__get_owner_key())
+            finally:
+                cart_item_qs.delete()
+                self.rebuild_summary()
+                self.touch()
 
-        user = self.__get_owner()
-        try:
-            api.bulk_release_tickets(
-                user.tempitura_session_key,
-                ticket_data_list
-            )
-        except api.APIError:
-            # TODO: maybe we should call transfer session?
-            logger.exception('Tickets remove error!')
-        finally:
-            ticket_qs.delete()
-            cart_item_qs.delete()
+    @instrumented('CartManager.remove_many', 'manager')
+    @routers.on_primary
+    def remove_many(self, ids=None, release=True):
+        """Remove several items of the cart at once
 
+        Items of other owners are ignored, products are released and deleted
+        with `remove_products`.
+
+        Args:
+            ids (list): cart item ids, all items are removed by default
+            release (bool): release products in Tempitura
+
+        Returns:
+            int: number of removed items
+
+        """
+        cart_item_qs = self.get_queryset()
+        if ids is not None:
+            cart_item_qs = cart_item_qs.filter(pk__in=ids)
+
+        items = list(cart_item_qs.values_list(
+            'id', 'content_type_id', 'object_id'))
+        if not items:
+            return 0
+
+        with outbox_transaction():
+            try:
+                remove_products(
+                    self.tempitura_session_key if release else None,
+                    [(content_type_id, object_id)
+                     for _, content_type_id, object_id in items],
+                    release=release,
+                    owner_key=self.__get_owner_key()
+                )
+            finally:
+                CartItem.objects.filter(
+                    pk__in=[item_id for item_id, _, _ in items]).delete()
+                self.rebuild_summary()
+                self.touch()
+
+        return len(items)
+
+    @instrumented('CartManager.get_types', 'manager')
     def get_types(self):
         """Return model names of products contains in the shopping cart"""
         # {'donation', 'packageproduct', 'ticket'}
-        items = self.get_queryset()
-        return tuple(set([item.product._meta.model_name for item in items]))
+        return self.get_summary().get_types()
 
+    @instrumented('CartManager.is_only_packages', 'manager')
     def is_only_packages(self):
         """Is cart contains only packages or empty"""
-        if self.get_queryset().count() == 0:
-            return True
-
-        return self.get_types() == ('packageproduct',)
+        return self.get_types() in ((), ('packageproduct',))
 
 
 class CartItem(TimeStampedModel):
@@ -181,13 +878,51 @@ class CartItem(TimeStampedModel):
     session_key = models.CharField(max_length=255, null=True, blank=True)
     is_paid = models.BooleanField(default=False)
 
+    # product price at the moment it was added to the cart, it allows to
+    # calculate cart totals without loading products
+    price = models.FloatField(null=True, blank=True)
+    quantity = models.PositiveIntegerField(default=1)
+
     cart_manager = CartManager()
     objects = models.Manager()
 
+    class Meta:
+        # these and partial indexes of unpaid items and session keys are
+        # created concurrently by 0004_cartitem_indexes migration
+        index_together = [
+            ('content_type', 'object_id'),
+        ]
+
     def delete(self, tempitura_session_key, *args, **kwargs):
-        self.product.delete_callback(tempitura_session_key)
-        self.product.delete()
-        super(CartItem, self).delete(*args, **kwargs)
+        owner_key = cart_cache.owner_key(
+            user_id=self.user_id, session_key=self.session_key)
+        if is_outbox_enabled():
+            # product is released and deleted by the outbox worker
+            with transaction.atomic():
+                OutboxOperation.objects.enqueue(
+                    OutboxOperation.DELETE_PRODUCTS,
+                    tempitura_session_key,
+                    products=[[self.content_type_id, self.object_id]],
+                    owner_key=owner_key
+                )
+                super(CartItem, self).delete(*args, **kwargs)
+                CartSummary.objects.rebuild(
+                    user_id=self.user_id, session_key=self.session_key)
+        else:
+            with measure('tempitura.delete_callback', 'remote'):
+                self.product.delete_callback(tempitura_session_key)
+            self.product.delete()
+            with transaction.atomic():
+                super(CartItem, self).delete(*args, **kwargs)
+                CartSummary.objects.rebuild(
+                    user_id=self.user_id, session_key=self.session_key)
+
+        cart_cache.bump_version(owner_key)
+
+    def set_snapshot(self, product):
+        snapshot = product.get_cart_snapshot()
+        self.price = snapshot['price']
+        self.quantity = snapshot['quantity']
 
     def clean(self):
         if not self.user and not self.session_key:
@@ -198,3 +933,193 @@ class CartItem(TimeStampedModel):
             return "Removed item"
 
         return self.product.get_title()
+
+
+def fill_snapshots(cart_item_qs):
+    """Fill price snapshot of items created before it was introduced"""
+    items = cart_item_qs.filter(
+        price__isnull=True).prefetch_related('product')
+    for item in items:
+        if item.product:
+            item.set_snapshot(item.product)
+        else:
+            # product was removed, it costs nothing
+            item.price, item.quantity = 0.0, 0
+        item.save(update_fields=['price', 'quantity'])
+
+
+def get_summary_owner(user_id=None, session_key=None):
+    if user_id:
+        return {'user_id': user_id}
+    return {'session_key': session_key}
+
+
+def transfer_summary(session_key, user_id):
+    """Move summary of the anonymous cart to the user"""
+    CartSummary.objects.rebuild(user_id=user_id)
+    CartSummary.objects.filter(session_key=session_key).delete()
+
+
+class CartSummaryManager(models.Manager):
+    def rebuild(self, user_id=None, session_key=None):
+        """Recalculate summary of the owner from its unpaid cart items
+
+        Totals are calculated by one query grouped by content type. Items
+        without price snapshot get it filled in here.
+
+        Returns:
+            dict: new values of the summary
+
+        """
+        owner = get_summary_owner(user_id, session_key)
+        cart_item_qs = CartItem.objects.filter(is_paid=False, **owner)
+
+        totals = self.__get_totals(cart_item_qs)
+        if any(row['unpriced'] for row in totals):
+            fill_snapshots(cart_item_qs)
+            totals = self.__get_totals(cart_item_qs)
+
+        values = {
+            'item_count': sum(row['count'] for row in totals),
+            'subtotal': sum(
+                (row['sub_total'] or 0.0 for row in totals), 0.0),
+            'content_types': CartSummary.encode_content_types(
+                row['content_type_id'] for row in totals),
+        }
+        if not values['item_count']:
+            values['expires_at'] = None
+
+        if not self.filter(**owner).update(**values):
+            try:
+                with transaction.atomic():
+                    self.create(**dict(values, **owner))
+            except IntegrityError:
+                # the summary is created by a concurrent request
+                self.filter(**owner).update(**values)
+
+        return values
+
+    def __get_totals(self, cart_item_qs):
+        return list(cart_item_qs.order_by().values('content_type_id').annotate(
+            count=Count('id'),
+            sub_total=Sum(
+                F('price') * F('quantity'),
+                output_field=models.FloatField()
+            ),
+            unpriced=Count(Case(When(price__isnull=True, then=1))),
+        ))
+
+    def add_items(self, items, user_id=None, session_key=None):
+        """Add new cart items to the summary of the owner with one UPDATE
+
+        The summary is rebuilt if there is no one yet or some items have
+        no price.
+
+        """
+        owner = get_summary_owner(user_id, session_key)
+        if any(item.price is None for item in items):
+            return self.rebuild(**owner)
+
+        # content type id is appended unless the set contains it already
+        content_types = F('content_types')
+        for content_type_id in sorted(set(
+                item.content_type_id for item in items)):
+            content_types = Concat(content_types, Case(
+                When(
+                    content_types__contains=',{},'.format(content_type_id),
+                    then=Value('')
+                ),
+                default=Value('{},'.format(content_type_id)),
+                output_field=models.CharField()
+            ))
+
+        updated = self.filter(**owner).update(
+            item_count=F('item_count') + len(items),
+            subtotal=F('subtotal') + sum(
+                (item.price * item.quantity for item in items), 0.0),
+            content_types=content_types,
+        )
+        if not updated:
+            self.rebuild(**owner)
+
+    def rebuild_all(self):
+        """Rebuild all summaries and create missing ones
+
+        Returns:
+            int: number of rebuilt summaries
+
+        """
+        count = 0
+        owners = self.order_by('id').values_list('user_id', 'session_key')
+        for user_id, session_key in owners.iterator():
+            self.rebuild(user_id, session_key)
+            count += 1
+
+        cart_item_qs = CartItem.objects.filter(is_paid=False).order_by()
+        user_ids = list(cart_item_qs.filter(
+            user__isnull=False, user__cart_summary__isnull=True
+        ).values_list('user_id', flat=True).distinct())
+        session_keys = list(cart_item_qs.filter(
+            user__isnull=True, session_key__isnull=False
+        ).exclude(
+            session_key__in=self.filter(
+                session_key__isnull=False).values('session_key')
+        ).values_list('session_key', flat=True).distinct())
+
+        for user_id in user_ids:
+            self.rebuild(user_id=user_id)
+        for session_key in session_keys:
+            self.rebuild(session_key=session_key)
+
+        return count + len(user_ids) + len(session_keys)
+
+
+class CartSummary(models.Model):
+    """Totals of unpaid cart items of one owner (user or session key)
+
+    CartManager updates the row together with the cart items, so the cart
+    badge and `is_only_packages` are one lookup. Use the
+    `cart_rebuild_summaries` command to fix drifted rows.
+
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        related_name="cart_summary",
+        null=True,
+        blank=True
+    )
+    session_key = models.CharField(
+        max_length=255, null=True, blank=True, unique=True)
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.FloatField(default=0.0)
+    # ids of product content types separated and surrounded by commas,
+    # ",12,15,"
+    content_types = models.CharField(max_length=255, default=',')
+    # reservation expiry of the cart reported by Tempitura
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    objects = CartSummaryManager()
+
+    @staticmethod
+    def encode_content_types(content_type_ids):
+        return ',' + ''.join(
+            '{},'.format(content_type_id)
+            for content_type_id in sorted(set(content_type_ids))
+        )
+
+    def get_content_type_ids(self):
+        return [
+            int(content_type_id)
+            for content_type_id in self.content_types.split(',')
+            if content_type_id
+        ]
+
+    def get_types(self):
+        """Model names of products contained in the cart"""
+        return tuple(set(
+            ContentType.objects.get_for_id(content_type_id).model
+            for content_type_id in self.get_content_type_ids()
+        ))
+
+    def __str__(self):
+        return 'Summary of {}'.format(self.user_id or self.session_key)
@@ -0,0 +1,79 @@
+import json
+from contextlib import contextmanager
+
+from django.db import models, transaction
+from django.conf import settings
+from django.utils import timezone
+
+from model_utils.models import TimeStampedModel
+
+
+def is_outbox_enabled():
+    return getattr(settings, 'CART_OUTBOX', False)
+
+
+@contextmanager
+def outbox_transaction():
+    """Transaction which keeps a cart change and its outbox operations
+    together, it does nothing when the outbox is turned off
+
+    """
+    if is_outbox_enabled():
+        with transaction.atomic():
+            yield
+    else:
+        yield
+
+
+class OutboxManager(models.Manager):
+    def enqueue(self, operation, tempitura_session_key, **payload):
+        """Save Tempitura operation to be done by the outbox worker"""
+        return self.create(
+            operation=operation,
+            tempitura_session_key=tempitura_session_key,
+            payload=json.dumps(payload),
+        )
+
+    def pending(self):
+        return self.filter(
+            is_failed=False,
+            next_attempt_at__lte=timezone.now()
+        ).order_by('id')
+
+
+class OutboxOperation(TimeStampedModel):
+    """Tempitura call saved in the same transaction as the cart change
+
+    Operations are done by the outbox worker (see cart.outbox), the request
+    doesn't wait for Tempitura.
+
+    """
+    RELEASE_TICKETS = 'release_tickets'
+    DELETE_PRODUCTS = 'delete_products'
+    TRANSFER_SESSION = 'transfer_session'
+    OPERATION_CHOICES = (
+        (RELEASE_TICKETS, 'Release tickets'),
+        (DELETE_PRODUCTS, 'Delete products'),
+        (TRANSFER_SESSION, 'Transfer session'),
+    )
+
+    operation = models.CharField(max_length=32, choices=OPERATION_CHOICES)
+    tempitura_session_key = models.CharField(max_length=255)
+    payload = models.TextField()
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    is_failed = models.BooleanField(default=False)
+
+    objects = OutboxManager()
+
+    class Meta:
+        index_together = [
+            ('is_failed', 'next_attempt_at'),
+        ]
+
+    def get_payload(self):
+        return json.loads(self.payload)
+
+    def __str__(self):
+        return '{} {}'.format(self.operation, self.tempitura_session_key)
@@ -1,7 +1,30 @@
-from django.db import models
+import logging
+import sys
+
+from django.db import models, transaction
+from django.contrib.contenttypes.models import ContentType
+from django.utils import six
+
+
+logger = logging.getLogger("private-project.{}".format(__name__))
 
 # TODO: move it somewhere
 class ProductMixin(models.Model):
+    # related objects loaded together with the products of a cart list, see
+    # CartManager.with_products
+    cart_select_related = ()
+    cart_prefetch_related = ()
+
+    @classmethod
+    def get_cart_queryset(cls):
+        """Queryset of products shown in a cart list"""
+        queryset = cls._default_manager.all()
+        if cls.cart_select_related:
+            queryset = queryset.select_related(*cls.cart_select_related)
+        if cls.cart_prefetch_related:
+            queryset = queryset.prefetch_related(*cls.cart_prefetch_related)
+        return queryset
+
     def get_title(self):
         raise NotImplementedError
 
@@ -11,17 +34,119 @@ class ProductMixin(models.Model):
     def get_cost(self):
         raise NotImplementedError
 
+    def get_cart_snapshot(self):
+        """Unit price and quantity saved on the cart item
+
+        Cost of the cart item is price * quantity.
+
+        """
+        return {'price': self.get_cost(), 'quantity': 1}
+
+    def refresh_cart_snapshot(self):
+        """Update saved price of unpaid cart items of the product
+
+        Should be called when cost of the product is changed.
+
+        """
+        from .cart import CartItem, CartSummary
+        cart_item_qs = CartItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(self),
+            object_id=self.pk,
+            is_paid=False
+        )
+        with transaction.atomic():
+            count = cart_item_qs.update(**self.get_cart_snapshot())
+            owners = cart_item_qs.order_by().values_list(
+                'user_id', 'session_key').distinct()
+            for user_id, session_key in owners:
+                CartSummary.objects.rebuild(user_id, session_key)
+        return count
+
+    def get_cart_expiry(self):
+        """Time the reservation of the product expires, None if it doesn't"""
+        return None
+
+    @classmethod
+    def get_cart_lines(cls, ids):
+        """Title, cost and expiry of products shown in the cart
+
+        Override it to read them with one values() query instead of loading
+        the products.
+
+        Returns:
+            dict: {pk: (title, cost, expiry)}
+
+        """
+        return dict(
+            (obj.pk, (obj.get_title(), obj.get_cost(), obj.get_cart_expiry()))
+            for obj in cls.get_cart_queryset().filter(pk__in=ids)
+        )
+
     def add_to_cart_callback(self, *args, **kwargs):
         raise NotImplementedError
 
+    @classmethod
+    def add_to_cart_callback_many(cls, tempitura_session_key, objects,
+                                  **kwargs):
+        """Reserve products of one model at once
+
+        Override it if the products can be reserved with one Tempitura call.
+        All products are reserved or none: if one of them fails, products
+        reserved before it are released and the error is raised.
+
+        """
+        reserved = []
+        try:
+            for obj in objects:
+                obj.add_to_cart_callback(tempitura_session_key, **kwargs)
+                reserved.append(obj)
+        except Exception:
+            exc_info = sys.exc_info()
+            if reserved:
+                try:
+                    cls.delete_callback_many(tempitura_session_key, reserved)
+                except Exception:
+                    logger.exception('Products release error!')
+            six.reraise(*exc_info)
+
     def checkout_callback(self, *args, **kwargs):
         raise NotImplementedError
 
+    @classmethod
+    def checkout_callback_many(cls, objects):
+        """Check out products of one model at once
+
+        Override it if the products can be checked out in bulk.
+
+        """
+        for obj in objects:
+            obj.checkout_callback()
+
     def transfer_to_user(self, user, *args, **kwargs):
         raise NotImplementedError
 
+    @classmethod
+    def transfer_to_user_many(cls, objects, user):
+        """Transfer products of one model to user at once
+
+        Override it if the products can be transferred in bulk.
+
+        """
+        for obj in objects:
+            obj.transfer_to_user(user)
+
     def delete_callback(self, tempitura_session_key, *args, **kwargs):
         raise NotImplementedError
 
+    @classmethod
+    def delete_callback_many(cls, tempitura_session_key, objects):
+        """Release products of one model at once
+
+        Override it if the products can be released with one Tempitura call.
+
+        """
+        for obj in objects:
+            obj.delete_callback(tempitura_session_key)
+
     class Meta:
         abstract = True
@@ -0,0 +1,197 @@
+"""Worker which does Tempitura operations saved in the outbox
+
+Pending operations are claimed in batches and grouped by Tempitura session.
+Operations of one session are coalesced (all ticket releases become one
+`bulk_release_tickets` call, products are released per model) and sessions
+are processed concurrently. Failed operations are retried with exponential
+backoff and marked as failed after `CART_OUTBOX_MAX_ATTEMPTS` attempts.
+Cached Tempitura lookups of the cart are invalidated when its operations are
+done, see cart.cache.
+
+Set `CART_OUTBOX = True` to move the ticket and product releases of the cart
+views and CartManager.remove_tickets to the outbox. The session transfer of
+the clean view stays synchronous, the next request depends on it.
+
+"""
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import cache as cart_cache
+from .gateway import gateway
+from .instrumentation import measure
+from .models import OutboxOperation, load_products
+
+
+logger = logging.getLogger("private-project.{}".format(__name__))
+
+
+def get_backoff(attempts):
+    """Seconds to wait before the next attempt"""
+    base = getattr(settings, 'CART_OUTBOX_BACKOFF', 5)
+    return min(base * 2 ** (attempts - 1), 3600)
+
+
+def claim(batch_size, lease=300):
+    """Take pending operations, other workers skip them for `lease` seconds"""
+    with transaction.atomic():
+        operations = list(
+            OutboxOperation.objects.pending().select_for_update()[:batch_size])
+        OutboxOperation.objects.filter(
+            pk__in=[operation.pk for operation in operations]
+        ).update(next_attempt_at=timezone.now() + timedelta(seconds=lease))
+    return operations
+
+
+def release_tickets(tempitura_session_key, operations):
+    tickets = []
+    for operation in operations:
+        for ticket in operation.get_payload()['tickets']:
+            if ticket not in tickets:
+                tickets.append(ticket)
+
+    gateway.bulk_release_tickets(
+        tempitura_session_key, [tuple(ticket) for ticket in tickets])
+
+
+def delete_products(tempitura_session_key, operations):
+    items = set()
+    for operation in operations:
+        items.update(
+            tuple(item) for item in operation.get_payload()['products'])
+
+    for model, objects in load_products(sorted(items)).items():
+        with measure('tempitura.delete_callback_many', 'remote'):
+            model.delete_callback_many(tempitura_session_key, objects)
+        model._default_manager.filter(
+            pk__in=[obj.pk for obj in objects]).delete()
+
+
+def transfer_session(tempitura_session_key, operations):
+    # not enqueued anymore, kept for operations saved before
+    # the session is transferred once whatever the number of requests was
+    payload = operations[-1].get_payload()
+    if payload.get('user_id'):
+        user = get_user_model().objects.get(pk=payload['user_id'])
+    else:
+        from accounts.models import AnonymousUser
+        user = AnonymousUser(payload['session_key'])
+
+    gateway.transfer_session(user)
+
+
+HANDLERS = {
+    OutboxOperation.RELEASE_TICKETS: release_tickets,
+    OutboxOperation.DELETE_PRODUCTS: delete_products,
+    OutboxOperation.TRANSFER_SESSION: transfer_session,
+}
+
+
+def process_session(tempitura_session_key, operations):
+    """Do operations of one Tempitura session
+
+    Returns:
+        list of (operations, error) pairs, error is None on success
+
+    """
+    by_type = OrderedDict()
+    for operation in operations:
+        by_type.setdefault(operation.operation, []).append(operation)
+
+    results = []
+    for operation_type, group in by_type.items():
+        try:
+            HANDLERS[operation_type](tempitura_session_key, group)
+        except Exception as e:
+            logger.exception(
+                "Outbox %s failed: tempitura key %s",
+                operation_type, tempitura_session_key)
+            results.append((group, e))
+        else:
+            results.append((group, None))
+
+    return results
+
+
+def _process_session_in_thread(args):
+    try:
+        return process_session(*args)
+    finally:
+        # worker threads must not keep database connections open
+        connections.close_all()
+
+
+def finish(operations, error):
+    ids = [operation.pk for operation in operations]
+    if error is None:
+        OutboxOperation.objects.filter(pk__in=ids).delete()
+        # lookups cached since the operations were saved don't show them
+        owners = set(
+            operation.get_payload().get('owner_key')
+            for operation in operations)
+        for owner in owners - set([None]):
+            cart_cache.bump_version(owner)
+        return
+
+    max_attempts = getattr(settings, 'CART_OUTBOX_MAX_ATTEMPTS', 10)
+    for operation in operations:
+        operation.attempts += 1
+        operation.last_error = repr(error)
+        operation.next_attempt_at = (
+            timezone.now() + timedelta(seconds=get_backoff(operation.attempts)))
+        operation.is_failed = operation.attempts >= max_attempts
+        operation.save(update_fields=[
+            'attempts', 'last_error', 'next_attempt_at', 'is_failed',
+            'modified'])
+
+
+def drain(batch_size=100, workers=8):
+    """Do pending operations
+
+    Returns:
+        int: number of processed operations
+
+    """
+    operations = claim(batch_size)
+    if not operations:
+        return 0
+
+    sessions = OrderedDict()
+    for operation in operations:
+        sessions.setdefault(
+            operation.tempitura_session_key, []).append(operation)
+
+    if workers > 1 and len(sessions) > 1:
+        pool = ThreadPool(min(workers, len(sessions)))
+        try:
+            results = pool.map(_process_session_in_thread, sessions.items())
+        finally:
+            pool.close()
+    else:
+        results = [process_session(*args) for args in sessions.items()]
+
+    for session_results in results:
+        for group, error in session_results:
+            finish(group, error)
+
+    return len(operations)
+
+
+def run(interval=5, batch_size=100, workers=8):
+    """Drain the outbox forever"""
+    while True:
+        try:
+            processed = drain(batch_size, workers)
+        except Exception:
+            logger.exception("Outbox drain failed")
+            processed = 0
+
+        if processed < batch_size:
+            time.sleep(interval)
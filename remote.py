@@ -0,0 +1,135 @@
+"""Concurrent execution of independent Tempitura calls
+
+Every `call_concurrently` call runs its calls on up to
+`CART_TEMPITURA_CONCURRENCY` threads of its own (4 by default), so calls of
+other requests never queue in front of them. Each call has to finish within
+`CART_TEMPITURA_TIMEOUT` seconds from the moment it starts running, the thread
+left with a timed out call is replaced, so the calls after it don't wait for
+it. Concurrency is disabled when `CART_TEMPITURA_CONCURRENCY` is 0, then calls
+run one by one in the current thread.
+
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger("private-project.{}".format(__name__))
+
+_local = threading.local()
+
+
+class RemoteTimeout(Exception):
+    pass
+
+
+def in_worker():
+    """Is the current thread a worker of `call_concurrently`"""
+    return getattr(_local, 'worker', False)
+
+
+class _Call(object):
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.started = threading.Event()
+        self.done = threading.Event()
+        self.started_at = None
+        self.result = None
+        self.error = None
+
+    def run(self):
+        self.started_at = time.time()
+        self.started.set()
+        try:
+            self.result = self.func(*self.args, **self.kwargs)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+    def wait(self, timeout):
+        """Wait for the call at most `timeout` seconds from its start
+
+        Returns:
+            bool: True if the call is done
+
+        """
+        self.started.wait()
+        return self.done.wait(
+            max(self.started_at + timeout - time.time(), 0))
+
+
+class _Batch(object):
+    """Calls of one `call_concurrently` and the threads which run them"""
+
+    def __init__(self, calls):
+        self.calls = [_Call(func, args, kwargs) for func, args, kwargs in calls]
+        self.queue = deque(self.calls)
+
+    def start_worker(self):
+        thread = threading.Thread(target=self.work)
+        thread.daemon = True
+        thread.start()
+
+    def work(self):
+        _local.worker = True
+        try:
+            while True:
+                try:
+                    call = self.queue.popleft()
+                except IndexError:
+                    return
+                call.run()
+        finally:
+            # worker threads must not keep database connections open
+            connections.close_all()
+
+
+def call_concurrently(calls, timeout=None):
+    """Run independent calls and wait for all of them
+
+    Args:
+        calls: list of (func, args, kwargs)
+        timeout (float): deadline of every call in seconds, counted from the
+            start of the call
+
+    Returns:
+        list of (result, error) in the same order as calls, error is
+        `RemoteTimeout` if the call didn't finish in time
+
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'CART_TEMPITURA_TIMEOUT', 10)
+
+    concurrency = getattr(settings, 'CART_TEMPITURA_CONCURRENCY', 4)
+    if not concurrency:
+        results = []
+        for func, args, kwargs in calls:
+            try:
+                results.append((func(*args, **kwargs), None))
+            except Exception as e:
+                results.append((None, e))
+        return results
+
+    batch = _Batch(calls)
+    for _ in range(min(concurrency, len(batch.calls))):
+        batch.start_worker()
+
+    results = []
+    for call in batch.calls:
+        if call.wait(timeout):
+            results.append((call.result, call.error))
+        else:
+            logger.warning(
+                "%s timed out", getattr(call.func, '__name__', call.func))
+            results.append((None, RemoteTimeout(call.func)))
+            # the thread is still busy with the call
+            batch.start_worker()
+
+    return results
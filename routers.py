@@ -0,0 +1,93 @@
+"""Routing of cart reads to a read replica
+
+Reads of the cart models go to the `CART_REPLICA_DATABASE` alias, writes go
+to the primary (default) database. Reads stay on the primary when
+
+* the thread has changed the cart: every write, and every CartManager
+  mutation before it reads anything, pins the thread to the primary, so it
+  reads what it has written;
+* they are made in a transaction of the primary, e.g. `select_for_update`;
+* the owner changed the cart less than `CART_REPLICA_STICKY_SECONDS` seconds
+  (5 by default) ago, `CartReplicaStickiness` middleware keeps that time in
+  the session.
+
+    CART_REPLICA_DATABASE = 'replica'
+    DATABASE_ROUTERS = ['cart.routers.CartRouter']
+
+"""
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+APP_LABEL = 'cart'
+
+_state = threading.local()
+
+
+def get_replica_database():
+    return getattr(settings, 'CART_REPLICA_DATABASE', None)
+
+
+def get_sticky_seconds():
+    return getattr(settings, 'CART_REPLICA_STICKY_SECONDS', 5)
+
+
+def reset(pinned=False):
+    """Forget the state of the previous request"""
+    _state.pinned = pinned
+    _state.written = False
+
+
+def pin_to_primary(written=False):
+    _state.pinned = True
+    if written:
+        _state.written = True
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def has_written():
+    return getattr(_state, 'written', False)
+
+
+def in_primary_transaction():
+    return connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+def on_primary(func):
+    """Decorator of cart mutations, reads they do go to the primary"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        pin_to_primary()
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def is_routed(model):
+    return model._meta.app_label == APP_LABEL and bool(get_replica_database())
+
+
+class CartRouter(object):
+    def db_for_read(self, model, **hints):
+        if not is_routed(model):
+            return None
+        if is_pinned() or in_primary_transaction():
+            return DEFAULT_DB_ALIAS
+        return get_replica_database()
+
+    def db_for_write(self, model, **hints):
+        if not is_routed(model):
+            return None
+        pin_to_primary(written=True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # cart items read from the replica refer to the primary objects
+        if is_routed(obj1) or is_routed(obj2):
+            return True
+        return None
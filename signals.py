@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.contrib.auth.signals import user_logged_in
 from django.dispatch import receiver
+from django.utils.module_loading import import_string
 from .models.cart import CartItem
 
 
@@ -9,6 +11,10 @@ def move_cart_items_to_logged_in_user(sender, user, request, **kwargs):
     to logged in user
 
     """
+    storage = getattr(settings, 'CART_ANONYMOUS_STORAGE', None)
+    if storage:
+        import_string(storage)(request.session).transfer_to_user(user)
+
     if not request.session.get('anonymous_session_key'):
         return
 
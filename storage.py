@@ -0,0 +1,514 @@
+"""Storage of anonymous carts
+
+Anonymous cart items are CartItem rows bound to the session by default.
+`SessionCart` keeps them in the session instead: every item is a compact
+[id, content type id, object id, price, quantity] entry, so browsing
+anonymously doesn't write to the CartItem table. The items become CartItem
+rows when the user logs in (`transfer_to_user`) or pays (`set_as_paid`).
+
+SessionCart has the same public API as CartManager. It is used for anonymous
+users when
+
+    CART_ANONYMOUS_STORAGE = 'cart.storage.SessionCart'
+
+Concurrent requests of one session (e.g. two tabs) read the session when
+they start and write it whole when they finish, so one of two concurrent
+adds would be lost while its product stays reserved. Cart changes are made
+under the cart lock (see `cache.owner_lock`) on the cart read again from the
+session store, which is saved at once. With the signed cookies backend the
+cart is saved with the response, there the last response still wins.
+
+"""
+import logging
+
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.backends.signed_cookies import (
+    SessionStore as CookieSessionStore)
+from django.db import transaction
+
+from . import cache as cart_cache
+from .instrumentation import instrumented, measure
+from .models import (
+    CartItem, CartSummary, OutboxOperation, add_idempotently,
+    attach_products, build_cart_lines, check_expired_tickets,
+    is_outbox_enabled, load_products, release_tickets, remove_products,
+    reserve_product, reserve_products)
+
+
+logger = logging.getLogger("private-project.{}".format(__name__))
+
+
+class SessionCartItem(object):
+    """Cart item kept in the session, it mimics CartItem"""
+
+    user = None
+    is_paid = False
+
+    def __init__(self, cart, id, content_type_id, object_id, price, quantity):
+        self.cart = cart
+        self.id = self.pk = id
+        self.content_type_id = content_type_id
+        self.object_id = object_id
+        self.price = price
+        self.quantity = quantity
+
+    @property
+    def session_key(self):
+        return self.cart.session.session_key
+
+    @property
+    def content_type(self):
+        return ContentType.objects.get_for_id(self.content_type_id)
+
+    @property
+    def product(self):
+        if not hasattr(self, '_product_cache'):
+            model = self.content_type.model_class()
+            self._product_cache = model._default_manager.filter(
+                pk=self.object_id).first()
+        return self._product_cache
+
+    def delete(self, tempitura_session_key, *args, **kwargs):
+        if is_outbox_enabled():
+            # product is released and deleted by the outbox worker
+            OutboxOperation.objects.enqueue(
+                OutboxOperation.DELETE_PRODUCTS,
+                tempitura_session_key,
+                products=[[self.content_type_id, self.object_id]]
+            )
+        else:
+            with measure('tempitura.delete_callback', 'remote'):
+                self.product.delete_callback(tempitura_session_key)
+            self.product.delete()
+        self.cart.remove_entries([self.id])
+
+    def __str__(self):
+        if not self.product:
+            return "Removed item"
+
+        return self.product.get_title()
+
+
+class SessionCartItems(object):
+    """List of session cart items with the queryset methods used by views"""
+
+    model = CartItem
+
+    def __init__(self, cart, items):
+        self.cart = cart
+        self.items = list(items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def all(self):
+        return self
+
+    def count(self):
+        return len(self.items)
+
+    def exists(self):
+        return bool(self.items)
+
+    def first(self):
+        return self.items[0] if self.items else None
+
+    def order_by(self, *fields):
+        items = self.items
+        for field in reversed(fields):
+            reverse = field.startswith('-')
+            field = field.lstrip('-')
+            if field == 'pk':
+                field = 'id'
+            items = sorted(
+                items, key=lambda item: getattr(item, field), reverse=reverse)
+        return SessionCartItems(self.cart, items)
+
+    def filter(self, **lookups):
+        items = self.items
+        for lookup, value in lookups.items():
+            field, _, operator = lookup.partition('__')
+            if field == 'pk':
+                field = 'id'
+            if field == 'content_type':
+                field, value = 'content_type_id', getattr(value, 'pk', value)
+
+            if operator == 'in':
+                values = set(int(v) for v in value)
+                items = [i for i in items if getattr(i, field) in values]
+            elif not operator:
+                items = [i for i in items if getattr(i, field) == int(value)]
+            else:
+                raise TypeError("Unsupported lookup {}".format(lookup))
+        return SessionCartItems(self.cart, items)
+
+    def get(self, **lookups):
+        items = self.filter(**lookups).items
+        if not items:
+            raise CartItem.DoesNotExist
+        if len(items) > 1:
+            raise CartItem.MultipleObjectsReturned
+        return items[0]
+
+    def values_list(self, *fields, **kwargs):
+        if kwargs.get('flat'):
+            return [getattr(item, fields[0]) for item in self.items]
+        return [
+            tuple(getattr(item, field) for field in fields)
+            for item in self.items
+        ]
+
+    def delete(self):
+        """Remove the items from the cart, products are kept"""
+        self.cart.remove_entries([item.id for item in self.items])
+
+
+class SessionCart(object):
+    """Anonymous cart kept in the session"""
+
+    session_data_key = '_cart_items'
+
+    def __init__(self, session):
+        self.session = session
+
+    @property
+    def _data(self):
+        return self.session.get(
+            self.session_data_key, {'next_id': 1, 'items': []})
+
+    def _is_stored(self):
+        """Session data is kept by the server, not in the cookie"""
+        return (
+            bool(self.session.session_key) and
+            not isinstance(self.session, CookieSessionStore)
+        )
+
+    def _change(self, change):
+        """Call `change(data)` on the cart data and save it
+
+        The data is read again from the session store under the cart lock
+        and the session is saved at once, so changes of concurrent requests
+        of the session are kept.
+
+        Returns:
+            result of `change`
+
+        """
+        with cart_cache.owner_lock(self._owner_key()):
+            if self._is_stored():
+                data = self.session.load().get(
+                    self.session_data_key, {'next_id': 1, 'items': []})
+            else:
+                data = self._data
+            result = change(data)
+            self._save(data)
+        self.touch()
+        return result
+
+    def _save(self, data):
+        modified = self.session.modified
+        self.session[self.session_data_key] = data
+        if self._is_stored():
+            self.session.save()
+            # the response must not write this cart over changes of the
+            # later requests, unless the session is changed otherwise
+            self.session.modified = modified
+
+    def _owner_key(self):
+        return cart_cache.owner_key(session_key=self.session.session_key)
+
+    @property
+    def tempitura_session_key(self):
+        from accounts.models import AnonymousUser
+        return AnonymousUser(self.session.session_key).tempitura_session_key
+
+    def touch(self):
+        """Mark the cart as changed, cached lookups are invalidated"""
+        cart_cache.bump_version(self._owner_key())
+
+    def cached(self, name, func, *args, **kwargs):
+        """Call `func` or return its result cached for the current cart"""
+        return cart_cache.get_or_call(
+            self._owner_key(), name, func, *args, **kwargs)
+
+    def all(self):
+        return SessionCartItems(self, [
+            SessionCartItem(self, *entry) for entry in self._data['items']
+        ])
+
+    def order_by(self, *fields):
+        return self.all().order_by(*fields)
+
+    def filter(self, **lookups):
+        return self.all().filter(**lookups)
+
+    def count(self):
+        return len(self._data['items'])
+
+    def exists(self):
+        return bool(self._data['items'])
+
+    def first(self):
+        return self.all().first()
+
+    def remove_entries(self, ids):
+        ids = set(ids)
+
+        def remove(data):
+            data['items'] = [
+                entry for entry in data['items'] if entry[0] not in ids
+            ]
+
+        self._change(remove)
+
+    def get_by_idempotency_key(self, idempotency_key):
+        """Cart item added by the request with the key"""
+        result = cart_cache.get_idempotency_result(
+            self._owner_key(), idempotency_key)
+        if result is None or result == cart_cache.IDEMPOTENCY_PENDING:
+            return None
+        return self.filter(pk=result).first()
+
+    @instrumented('SessionCart.new', 'manager')
+    def new(self, product, idempotency_key=None, **kwargs):
+        """Add any item to the shopping cart
+
+        Args:
+            idempotency_key (str): key of the request, see `CartManager.new`
+
+        Returns:
+            SessionCartItem object
+
+        """
+        if not self.session.session_key:
+            # anonymous user is identified by the session key
+            self.session.save()
+
+        if idempotency_key:
+            return add_idempotently(
+                self._owner_key(), idempotency_key, product,
+                lambda: self._add(product, **kwargs),
+                lambda item_id: self.filter(pk=item_id).first()
+            )
+
+        return self._add(product, **kwargs)
+
+    def _add(self, product, **kwargs):
+        tempitura_session_key = self.tempitura_session_key
+
+        logger.debug("New cart item: tempitura key %s", tempitura_session_key)
+
+        # SessionCart provides the part of CartManager API used there
+        check_expired_tickets(self, tempitura_session_key)
+        reserve_product(tempitura_session_key, product, **kwargs)
+
+        return self._add_entries([product])[0]
+
+    @instrumented('SessionCart.new_many', 'manager')
+    def new_many(self, products, **kwargs):
+        """Add several items to the shopping cart at once
+
+        Returns:
+            list of SessionCartItem objects
+
+        """
+        products = list(products)
+        if not products:
+            return []
+
+        if not self.session.session_key:
+            self.session.save()
+
+        tempitura_session_key = self.tempitura_session_key
+
+        check_expired_tickets(self, tempitura_session_key)
+        reserve_products(tempitura_session_key, products, **kwargs)
+
+        return self._add_entries(products)
+
+    def _add_entries(self, products):
+        snapshots = [
+            (ContentType.objects.get_for_model(product).pk, product.pk,
+             product.get_cart_snapshot())
+            for product in products
+        ]
+
+        def add(data):
+            entries = []
+            for content_type_id, object_id, snapshot in snapshots:
+                entries.append([
+                    data['next_id'], content_type_id, object_id,
+                    snapshot['price'], snapshot['quantity'],
+                ])
+                data['next_id'] += 1
+            data['items'].extend(entries)
+            return entries
+
+        entries = self._change(add)
+        return [SessionCartItem(self, *entry) for entry in entries]
+
+    def _build_cart_items(self, entries, **owner_object_data):
+        return [
+            CartItem(
+                content_type_id=content_type_id,
+                object_id=object_id,
+                price=price,
+                quantity=quantity,
+                **owner_object_data
+            )
+            for _, content_type_id, object_id, price, quantity in entries
+        ]
+
+    @instrumented('SessionCart.transfer_to_user', 'manager')
+    def transfer_to_user(self, user):
+        """Write cart items as CartItem rows of the user"""
+        if not self._data['items']:
+            return
+
+        def transfer(data):
+            items = data['items']
+            if not items:
+                return False
+
+            # the session is saved by `_change` only if the rows are written
+            with transaction.atomic():
+                cart_items = self._build_cart_items(items, user=user)
+                CartItem.objects.bulk_create(cart_items)
+                CartSummary.objects.add_items(cart_items, user_id=user.pk)
+
+                products = load_products(
+                    (content_type_id, object_id)
+                    for _, content_type_id, object_id, _, _ in items
+                )
+                for model, objects in products.items():
+                    model.transfer_to_user_many(objects, user)
+
+            data['items'] = []
+            return True
+
+        if self._change(transfer):
+            cart_cache.bump_version(cart_cache.owner_key(user_id=user.pk))
+
+    @instrumented('SessionCart.set_as_paid', 'manager')
+    def set_as_paid(self):
+        """Write cart items as CartItem rows of the session and pay them"""
+        if not self._data['items']:
+            return 0
+
+        # the session may be kept outside of the database, items are bound
+        # to its key only
+        session_key = self.session.session_key
+
+        def pay(data):
+            if not data['items']:
+                return 0
+
+            with transaction.atomic():
+                CartItem.objects.bulk_create(self._build_cart_items(
+                    data['items'], session_key=session_key))
+                count = CartItem.cart_manager.set_as_paid(session_key)
+
+            data['items'] = []
+            return count
+
+        return self._change(pay)
+
+    @instrumented('SessionCart.with_products', 'manager')
+    def with_products(self, cart_items=None):
+        """Cart items with their products loaded by one query per model"""
+        if cart_items is None:
+            cart_items = self.order_by('id')
+        items = list(cart_items)
+        attach_products(items)
+        return items
+
+    @instrumented('SessionCart.lines', 'manager')
+    def lines(self):
+        """Read-only lines of the cart ordered by id"""
+        return build_cart_lines(
+            sorted(tuple(entry) for entry in self._data['items']))
+
+    @instrumented('SessionCart.total_cost', 'manager')
+    def total_cost(self):
+        return self.summary()['sub_total']
+
+    @instrumented('SessionCart.summary', 'manager')
+    def summary(self):
+        items = self._data['items']
+        return {
+            'count': len(items),
+            'sub_total': sum(
+                (price * quantity for _, _, _, price, quantity in items),
+                0.0
+            ),
+        }
+
+    def set_expiration(self, expires_at):
+        """Expiry is not kept, the summary is calculated from the session"""
+
+    @instrumented('SessionCart.remove_tickets', 'manager')
+    def remove_tickets(self, batch_size=None):
+        """Release and remove all tickets of the cart"""
+        from tickets.models import Ticket
+        logger.debug("Remove all tickets")
+        content_type_id = ContentType.objects.get_for_model(Ticket).pk
+        entries = [
+            entry for entry in self._data['items']
+            if entry[1] == content_type_id
+        ]
+
+        try:
+            release_tickets(
+                self.tempitura_session_key,
+                [entry[2] for entry in entries],
+                batch_size,
+                owner_key=self._owner_key()
+            )
+        finally:
+            self.remove_entries([entry[0] for entry in entries])
+
+    @instrumented('SessionCart.remove_many', 'manager')
+    def remove_many(self, ids=None, release=True):
+        """Remove several items of the cart at once
+
+        Returns:
+            int: number of removed items
+
+        """
+        entries = self._data['items']
+        if ids is not None:
+            ids = set(int(item_id) for item_id in ids)
+            entries = [entry for entry in entries if entry[0] in ids]
+        if not entries:
+            return 0
+
+        try:
+            remove_products(
+                self.tempitura_session_key if release else None,
+                [(entry[1], entry[2]) for entry in entries],
+                release=release,
+                owner_key=self._owner_key()
+            )
+        finally:
+            self.remove_entries([entry[0] for entry in entries])
+
+        return len(entries)
+
+    @instrumented('SessionCart.get_types', 'manager')
+    def get_types(self):
+        """Return model names of products contains in the shopping cart"""
+        return tuple(set(
+            ContentType.objects.get_for_id(entry[1]).model
+            for entry in self._data['items']
+        ))
+
+    @instrumented('SessionCart.is_only_packages', 'manager')
+    def is_only_packages(self):
+        """Is cart contains only packages or empty"""
+        return self.get_types() in ((), ('packageproduct',))
@@ -0,0 +1,108 @@
+"""Removal of expired tickets outside of the request cycle
+
+Carts with unpaid tickets are streamed in chunks, the expiration of each
+Tempitura session is checked concurrently and tickets of the expired sessions
+are released with `CartManager.remove_tickets`. Every check has its own
+deadline, counted from its start, so however large the chunk is, the last
+carts of it aren't skipped as timed out.
+
+Set `CART_INLINE_EXPIRY_CHECK = False` to stop `CartManager.new` from doing
+the same on every add-to-cart when the sweeper is running.
+
+"""
+import logging
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+from .gateway import gateway
+from .models import CartItem
+from .remote import RemoteTimeout, call_concurrently
+from .utils import chunks
+
+
+logger = logging.getLogger("private-project.{}".format(__name__))
+
+
+def get_ticket_content_type():
+    from tickets.models import Ticket
+    return ContentType.objects.get_for_model(Ticket)
+
+
+def get_cart_managers(chunk_size):
+    """Yield chunks of cart managers of owners who have unpaid tickets"""
+    owners = CartItem.objects.filter(
+        is_paid=False,
+        content_type=get_ticket_content_type()
+    ).exclude(
+        user__isnull=True, session__isnull=True
+    ).order_by().values_list('user', 'session').distinct()
+
+    for chunk in chunks(owners.iterator(), chunk_size):
+        users = get_user_model().objects.in_bulk(
+            [user_id for user_id, _ in chunk if user_id])
+
+        managers = []
+        for user_id, session_key in chunk:
+            if user_id:
+                if user_id in users:
+                    managers.append(users[user_id].cart_items)
+            else:
+                managers.append(Session(session_key=session_key).cart_items)
+
+        yield managers
+
+
+def is_expired(expiration, error):
+    from tempitura.exceptions import APIError
+    if isinstance(error, RemoteTimeout):
+        return False
+    if isinstance(error, APIError):
+        # Tempitura doesn't know the cart anymore
+        return True
+    if error:
+        raise error
+
+    return bool(expiration and expiration < timezone.now())
+
+
+def sweep(chunk_size=100, batch_size=50):
+    """Remove expired tickets of all carts
+
+    Returns:
+        int: number of carts with removed tickets
+
+    """
+    removed = 0
+    for managers in get_cart_managers(chunk_size):
+        keys = [manager.tempitura_session_key for manager in managers]
+        results = call_concurrently([
+            (gateway.get_ticket_expiration, (key,), {'as_utc': True})
+            for key in keys
+        ])
+
+        for manager, key, (expiration, error) in zip(managers, keys, results):
+            if is_expired(expiration, error):
+                logger.debug("Tickets expired: tempitura key %s", key)
+                manager.remove_tickets(batch_size=batch_size)
+                removed += 1
+            elif expiration and not error:
+                manager.set_expiration(expiration)
+
+    return removed
+
+
+def run(interval=60, chunk_size=100, batch_size=50):
+    """Sweep expired tickets forever"""
+    while True:
+        started = time.time()
+        try:
+            removed = sweep(chunk_size, batch_size)
+            logger.info("Expired tickets removed from %d carts", removed)
+        except Exception:
+            logger.exception("Expired tickets sweep failed")
+
+        time.sleep(max(interval - (time.time() - started), 0))
@@ -0,0 +1,4 @@
+from .stubs import install
+
+# the project packages are stubbed when the app is tested on its own
+install()
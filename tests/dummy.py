@@ -0,0 +1,136 @@
+"""Product models used by the cart tests instead of the project products"""
+from django.contrib.auth import get_user_model
+from django.db import connection, models
+from django.test import TestCase
+
+from mock import patch
+
+from cart.models import ProductMixin
+from . import stubs
+from .fake_tempitura import FakeTempitura
+
+
+class DummyProduct(ProductMixin):
+    title = models.CharField(max_length=255)
+    cost = models.FloatField(default=1.0)
+
+    # Tempitura fake used by the callbacks, see fake_tempitura.FakeTempitura
+    tempitura = None
+
+    class Meta:
+        app_label = 'cart'
+
+    def get_title(self):
+        return self.title
+
+    def get_description(self):
+        return self.title
+
+    def get_cost(self):
+        return self.cost
+
+    @classmethod
+    def get_cart_lines(cls, ids):
+        return dict(
+            (pk, (title, cost, None))
+            for pk, title, cost in cls.objects.filter(
+                pk__in=ids).values_list('id', 'title', 'cost')
+        )
+
+    def add_to_cart_callback(self, tempitura_session_key, **kwargs):
+        self.tempitura.add_to_cart(tempitura_session_key, self.pk)
+
+    def checkout_callback(self, *args, **kwargs):
+        pass
+
+    def transfer_to_user(self, user, *args, **kwargs):
+        pass
+
+    def delete_callback(self, tempitura_session_key, *args, **kwargs):
+        self.tempitura.release(tempitura_session_key, self.pk)
+
+
+class DummyPerformance(models.Model):
+    tempitura_no = models.PositiveIntegerField()
+
+    class Meta:
+        app_label = 'cart'
+
+
+class DummyTicket(ProductMixin):
+    """Ticket with the fields read by `release_tickets`
+
+    It replaces `tickets.models.Ticket` when patched as that.
+
+    """
+    performance = models.ForeignKey(DummyPerformance)
+    li_seq_no = models.PositiveIntegerField()
+    cost = models.FloatField(default=1.0)
+
+    class Meta:
+        app_label = 'cart'
+
+    def get_title(self):
+        return 'ticket {}'.format(self.li_seq_no)
+
+    def get_description(self):
+        return self.get_title()
+
+    def get_cost(self):
+        return self.cost
+
+
+MODELS = (DummyProduct, DummyPerformance, DummyTicket)
+
+
+def create_tables():
+    """Create tables of the test models
+
+    Test cases call it in their class transaction, which drops the tables.
+    Others have to call `drop_tables`.
+
+    """
+    with connection.schema_editor() as schema_editor:
+        for model in MODELS:
+            schema_editor.create_model(model)
+
+
+def drop_tables():
+    with connection.schema_editor() as schema_editor:
+        for model in reversed(MODELS):
+            schema_editor.delete_model(model)
+
+
+class CartTestCase(TestCase):
+    """Test case with the dummy product tables and fake Tempitura
+
+    Tempitura is replaced by `self.tempitura`, tickets by DummyTicket. Patches
+    of `get_patches` are started in setUp and stopped after the test.
+
+    """
+    tempitura_latency = 0.0
+    # Tempitura session key of all users, the real one is used when None
+    tempitura_session_key = None
+
+    @classmethod
+    def setUpClass(cls):
+        super(CartTestCase, cls).setUpClass()
+        create_tables()
+
+    def setUp(self):
+        self.tempitura = FakeTempitura(latency=self.tempitura_latency)
+        for patcher in self.get_patches():
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_patches(self):
+        patches = self.tempitura.patchers() + [
+            patch.object(DummyProduct, 'tempitura', self.tempitura),
+            patch('tickets.models.Ticket', DummyTicket),
+            patch('accounts.models.AnonymousUser', stubs.AnonymousUser),
+        ]
+        if self.tempitura_session_key is not None:
+            patches.append(patch.object(
+                get_user_model(), 'tempitura_session_key',
+                self.tempitura_session_key, create=True))
+        return patches
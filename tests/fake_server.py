@@ -0,0 +1,91 @@
+"""Local HTTP server which serves a FakeTempitura to `HTTPTransport`"""
+import datetime
+import json
+import socket
+import threading
+
+from django.utils.six.moves import BaseHTTPServer, socketserver
+
+
+def encode(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    raise TypeError(repr(obj))
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # connections are kept alive
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        tempitura = self.server.tempitura
+        length = int(self.headers['Content-Length'])
+        request = json.loads(self.rfile.read(length).decode('utf-8'))
+        name = self.path.rsplit('/', 1)[-1]
+
+        try:
+            result = getattr(tempitura, name)(
+                *request['args'], **request['kwargs'])
+            response = {'result': result}
+        except tempitura.APIError as e:
+            response = {'error': str(e)}
+
+        body = json.dumps(response, default=encode).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, tempitura):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.tempitura = tempitura
+        # accepted connections
+        self.requests = []
+
+    def process_request(self, request, client_address):
+        self.requests.append(request)
+        socketserver.ThreadingMixIn.process_request(
+            self, request, client_address)
+
+    def handle_error(self, request, client_address):
+        # clients which timed out have closed the connection
+        pass
+
+
+class FakeTempituraServer(object):
+    """HTTP server of `tempitura` in a thread, use it as a context manager"""
+
+    def __init__(self, tempitura):
+        self.server = Server(tempitura)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/api'.format(self.server.server_port)
+
+    @property
+    def connections(self):
+        return len(self.server.requests)
+
+    def __enter__(self):
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        # handlers of the kept alive connections are waiting for requests
+        for request in self.server.requests:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        self.server.server_close()
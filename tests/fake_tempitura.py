@@ -0,0 +1,74 @@
+"""In-process fake of `tempitura.api` with configurable latency"""
+import threading
+import time
+
+from mock import patch
+
+from . import stubs
+
+
+class FakeTempitura(object):
+    APIError = stubs.APIError
+    TaskIsPending = stubs.TaskIsPending
+
+    def __init__(self, latency=0.0, expiration=None):
+        self.latency = latency
+        self.expiration = expiration
+        self.calls = []
+        self.lock = threading.Lock()
+        # number of calls running at the moment and its maximum
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _call(self, name, *args):
+        with self.lock:
+            self.calls.append((name, args))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def get_cart(self, tempitura_session_key, **kwargs):
+        self._call('get_cart', tempitura_session_key)
+        return {'Order': {'HandlingCharges': '2.5'}}
+
+    def get_ticket_expiration(self, tempitura_session_key, **kwargs):
+        self._call('get_ticket_expiration', tempitura_session_key)
+        return self.expiration
+
+    def bulk_release_tickets(self, tempitura_session_key, ticket_data_list):
+        self._call(
+            'bulk_release_tickets', tempitura_session_key, ticket_data_list)
+
+    def transfer_session(self, user):
+        self._call('transfer_session', user)
+
+    def add_to_cart(self, tempitura_session_key, *products):
+        self._call('add_to_cart', tempitura_session_key, products)
+
+    def release(self, tempitura_session_key, *products):
+        self._call('release', tempitura_session_key, products)
+
+    def remove_expired_tickets(self, cart_items, tempitura_session_key):
+        self._call('remove_expired_tickets', tempitura_session_key)
+
+    def count(self, name):
+        return len([call for call in self.calls if call[0] == name])
+
+    def patchers(self):
+        """Patches which replace Tempitura api used by the cart app
+
+        The cart app imports Tempitura where it calls it, so the api is
+        replaced in the tempitura package. Errors are the ones of the fake.
+
+        """
+        return [
+            patch('tempitura.api', self),
+            patch('tempitura.exceptions.APIError', self.APIError),
+            patch('tempitura.utils.remove_expired_tickets',
+                  self.remove_expired_tickets),
+        ]
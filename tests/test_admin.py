@@ -0,0 +1,81 @@
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from cart.admin import CartItemAdmin, EstimatedCountPaginator, export_csv
+from cart.models import CartItem
+from .dummy import CartTestCase, DummyProduct
+
+
+class TestCartItemAdmin(CartTestCase):
+    def setUp(self):
+        super(TestCartItemAdmin, self).setUp()
+        self.user = get_user_model().objects.create_user('test', 'password')
+        self.admin_user = get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.model_admin = CartItemAdmin(CartItem, admin.site)
+        self.factory = RequestFactory()
+
+    def add_items(self, count, **kwargs):
+        for _ in range(count):
+            product = DummyProduct.objects.create(title='seat')
+            CartItem.objects.create(product=product, price=1.0, **kwargs)
+
+    def get_changelist(self, **params):
+        request = self.factory.get('/', params)
+        request.user = self.admin_user
+        response = self.model_admin.changelist_view(request)
+        response.render()
+        return response
+
+    def count_changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get_changelist()
+        return len(queries)
+
+    def test_changelist_queries_dont_depend_on_rows(self):
+        self.add_items(2, user=self.user)
+        queries = self.count_changelist_queries()
+
+        self.add_items(10, user=self.user)
+        self.assertEqual(self.count_changelist_queries(), queries)
+
+    def test_owner_filter(self):
+        self.add_items(2, user=self.user)
+        self.add_items(3, session_key='key')
+
+        response = self.get_changelist(owner='session')
+        self.assertEqual(
+            set(item.session_key
+                for item in response.context_data['cl'].result_list),
+            set(['key']))
+
+    @override_settings(CART_ADMIN_COUNT_LIMIT=3)
+    def test_filtered_count_is_limited(self):
+        self.add_items(5, user=self.user)
+
+        self.assertEqual(EstimatedCountPaginator(
+            CartItem.objects.filter(is_paid=False), 10).count, 3)
+        # without table statistics unfiltered queryset is counted up to
+        # the limit too
+        if connection.vendor == 'sqlite':
+            self.assertEqual(
+                EstimatedCountPaginator(CartItem.objects.all(), 10).count, 3)
+
+    @override_settings(CART_ADMIN_EXPORT_CHUNK_SIZE=2)
+    def test_export_csv(self):
+        self.add_items(5, user=self.user)
+        request = self.factory.post('/')
+        request.user = self.admin_user
+
+        with CaptureQueriesContext(connection) as queries:
+            response = export_csv(
+                self.model_admin, request, CartItem.objects.all())
+        self.assertEqual(len(queries), 0)
+
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[0].startswith(b'id,created,user_id'))
+        self.assertIn(b',seat,', lines[1])
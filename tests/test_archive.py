@@ -0,0 +1,71 @@
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+
+from cart import archive
+from cart.models import CartItem, PaidCartItem
+from .dummy import DummyProduct, create_tables
+
+
+class TestArchive(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(TestArchive, cls).setUpClass()
+        create_tables()
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('test', 'password')
+
+    def add(self, cost=1, **kwargs):
+        product = DummyProduct.objects.create(title='product', cost=cost)
+        return CartItem.objects.create(
+            product=product, user=self.user, price=cost, **kwargs)
+
+    @override_settings(CART_ARCHIVE_ON_PAY=True)
+    def test_set_as_paid_moves_items(self):
+        items = [self.add(cost) for cost in (1, 2)]
+
+        self.assertEqual(self.user.cart_items.set_as_paid(), 2)
+
+        self.assertFalse(CartItem.objects.exists())
+        paid_items = list(self.user.paid_cart_items.order_by('cart_item_id'))
+        self.assertEqual(
+            [(paid.cart_item_id, paid.product, paid.price)
+             for paid in paid_items],
+            [(item.pk, item.product, item.price) for item in items]
+        )
+
+    def test_set_as_paid_keeps_items_by_default(self):
+        self.add()
+
+        self.assertEqual(self.user.cart_items.set_as_paid(), 1)
+
+        self.assertTrue(CartItem.objects.get().is_paid)
+        self.assertFalse(PaidCartItem.objects.exists())
+
+    def test_backfill(self):
+        paid = [self.add(is_paid=True) for _ in range(5)]
+        unpaid = self.add()
+
+        self.assertEqual(archive.backfill(chunk_size=2), 5)
+
+        self.assertEqual(list(CartItem.objects.all()), [unpaid])
+        self.assertEqual(
+            sorted(PaidCartItem.objects.values_list(
+                'cart_item_id', flat=True)),
+            [item.pk for item in paid]
+        )
+        self.assertEqual(
+            PaidCartItem.objects.get(cart_item_id=paid[0].pk).paid_at,
+            paid[0].modified
+        )
+
+    def test_command(self):
+        self.add(is_paid=True)
+
+        out = StringIO()
+        call_command('cart_archive_paid_items', stdout=out)
+
+        self.assertIn('1 paid cart items archived', out.getvalue())
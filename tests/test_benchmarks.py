@@ -0,0 +1,277 @@
+"""Cost of the cart operations for different cart sizes
+
+Every operation is timed for carts of CART_BENCH_SIZES items (1,10,100,1000
+by default) and has to stay within its query budget whatever the cart size
+is. Tempitura is replaced by an in-process fake, its latency is set by
+CART_BENCH_LATENCY in seconds. Timings are printed when the tests finish,
+with memory kept by the cart lists.
+
+"""
+import os
+import sys
+import time
+import types
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from cart.models import CartItem, CartSummary
+from cart.views import Cart, ItemDelete, clean
+from .dummy import CartTestCase, DummyPerformance, DummyProduct, DummyTicket
+
+
+SIZES = [
+    int(size)
+    for size in os.environ.get('CART_BENCH_SIZES', '1,10,100,1000').split(',')
+]
+LATENCY = float(os.environ.get('CART_BENCH_LATENCY', '0'))
+
+# Max number of queries of every operation, transactions add savepoint
+# queries. None means the operation has no budget yet.
+QUERY_BUDGETS = {
+    'new': 4,
+    'total_cost': 1,
+    'get_types': 1,
+    'transfer_to_user': 8,
+    'set_as_paid': 7,
+    'remove_tickets': 10,
+    'Cart': 2,
+    'Cart lines': 2,
+    'with_products': 2,
+    'lines': 2,
+    'remove_many': 6,
+    'ItemDelete': 8,
+    'clean': 5,
+}
+
+
+def sizeof(obj, seen=None):
+    """Summed sys.getsizeof of the object and everything it refers to
+
+    Objects shared by several ones (content types, interned strings) are
+    counted once, classes and modules are not counted.
+
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen or isinstance(obj, (type, types.ModuleType)):
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(
+            sizeof(key, seen) + sizeof(value, seen)
+            for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(sizeof(value, seen) for value in obj)
+    if hasattr(obj, '__dict__'):
+        size += sizeof(obj.__dict__, seen)
+    return size
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'cart-benchmarks',
+    }
+})
+class TestCartBenchmarks(CartTestCase):
+    tempitura_latency = LATENCY
+    tempitura_session_key = 'bench'
+
+    results = []
+    memory = []
+
+    @classmethod
+    def tearDownClass(cls):
+        super(TestCartBenchmarks, cls).tearDownClass()
+        cls.report()
+
+    @classmethod
+    def report(cls):
+        sys.stdout.write('\n{:<20}{:>8}{:>10}{:>12}\n'.format(
+            'operation', 'size', 'queries', 'ms'))
+        for name, size, queries, seconds in cls.results:
+            sys.stdout.write('{:<20}{:>8}{:>10}{:>12.2f}\n'.format(
+                name, size, queries, seconds * 1000))
+
+        if cls.memory:
+            sys.stdout.write('\n{:<20}{:>8}{:>10}\n'.format(
+                'list', 'size', 'KiB'))
+            for name, size, kept in cls.memory:
+                sys.stdout.write('{:<20}{:>8}{:>10.1f}\n'.format(
+                    name, size, kept / 1024.0))
+
+    def setUp(self):
+        super(TestCartBenchmarks, self).setUp()
+        self.user = get_user_model().objects.create_user('test', 'password')
+        self.factory = RequestFactory()
+
+        # content types are cached on first use, don't count it
+        ContentType.objects.get_for_model(DummyTicket)
+
+    def fill(self, size, tickets=False, **owner):
+        """Create cart of `size` items, of tickets if `tickets` is set"""
+        CartItem.objects.all().delete()
+        CartSummary.objects.all().delete()
+        DummyProduct.objects.all().delete()
+        DummyTicket.objects.all().delete()
+
+        if tickets:
+            performance = DummyPerformance.objects.create(tempitura_no=1)
+            DummyTicket.objects.bulk_create([
+                DummyTicket(performance=performance, li_seq_no=i, cost=i)
+                for i in range(size)
+            ])
+            products = DummyTicket.objects.all()
+        else:
+            DummyProduct.objects.bulk_create([
+                DummyProduct(title='product {}'.format(i), cost=i)
+                for i in range(size)
+            ])
+            products = DummyProduct.objects.all()
+
+        CartItem.objects.bulk_create([
+            CartItem(product=product, price=product.cost, **owner)
+            for product in products
+        ])
+        CartSummary.objects.rebuild(user_id=self.user.pk)
+        if 'session_key' in owner:
+            CartSummary.objects.rebuild(session_key=owner['session_key'])
+
+    def request(self, method='get', path='/', **kwargs):
+        request = getattr(self.factory, method)(path, **kwargs)
+        request.user = self.user
+        return request
+
+    def measure(self, name, size, func):
+        """Time `func` and check its query budget
+
+        Returns:
+            result of `func`
+
+        """
+        with CaptureQueriesContext(connection) as queries:
+            started = time.time()
+            result = func()
+            elapsed = time.time() - started
+
+        self.results.append((name, size, len(queries), elapsed))
+
+        budget = QUERY_BUDGETS[name]
+        if budget is not None:
+            self.assertLessEqual(
+                len(queries), budget,
+                '{} made {} queries for cart of {} items:\n{}'.format(
+                    name, len(queries), size,
+                    '\n'.join(query['sql'] for query in queries)
+                )
+            )
+        return result
+
+    def measure_memory(self, name, size, func):
+        """Memory kept by the result of `func`, see `sizeof`"""
+        self.memory.append((name, size, sizeof(func())))
+
+    def test_new(self):
+        for size in SIZES:
+            self.fill(size, user=self.user)
+            product = DummyProduct.objects.create(title='new')
+            self.measure(
+                'new', size, lambda: self.user.cart_items.new(product))
+
+    def test_total_cost(self):
+        for size in SIZES:
+            self.fill(size, user=self.user)
+            self.measure('total_cost', size, self.user.cart_items.total_cost)
+
+    def test_get_types(self):
+        for size in SIZES:
+            self.fill(size, user=self.user)
+            self.measure('get_types', size, self.user.cart_items.get_types)
+
+    def test_transfer_to_user(self):
+        for size in SIZES:
+            self.fill(size, session_key='anonymous')
+            self.measure(
+                'transfer_to_user', size,
+                lambda: CartItem.cart_manager.transfer_to_user(
+                    'anonymous', self.user)
+            )
+            self.assertEqual(self.user.cart_items.count(), size)
+
+    def test_set_as_paid(self):
+        for size in SIZES:
+            self.fill(size, user=self.user)
+            self.measure('set_as_paid', size, self.user.cart_items.set_as_paid)
+            self.assertEqual(self.user.cart_items.count(), 0)
+
+    def test_remove_tickets(self):
+        for size in SIZES:
+            self.fill(size, tickets=True, user=self.user)
+            self.measure(
+                'remove_tickets', size, self.user.cart_items.remove_tickets)
+            self.assertEqual(self.user.cart_items.count(), 0)
+            self.assertFalse(DummyTicket.objects.exists())
+
+        # all tickets of a cart are released with one call
+        self.assertEqual(
+            self.tempitura.count('bulk_release_tickets'), len(SIZES))
+
+    def test_remove_many(self):
+        for size in SIZES:
+            self.fill(size, user=self.user)
+            ids = list(
+                self.user.cart_items.values_list('id', flat=True)[::2])
+            self.measure(
+                'remove_many', size,
+                lambda: self.user.cart_items.remove_many(ids))
+            self.assertEqual(self.user.cart_items.count(), size // 2)
+
+    def test_cart_view(self):
+        for size in SIZES:
+            self.fill(size, user=self.user)
+            self.measure(
+                'Cart', size, lambda: Cart.as_view()(self.request()))
+
+    def test_cart_view_lines(self):
+        view = Cart.as_view(render_lines=True)
+        for size in SIZES:
+            self.fill(size, user=self.user)
+            response = self.measure(
+                'Cart lines', size, lambda: view(self.request()))
+
+            self.assertEqual(
+                response.template_name, ['cart/cartline_list.html'])
+            self.assertEqual(len(response.context_data['cartline_list']), size)
+            response.render()
+            self.assertContains(response, 'product {}'.format(size - 1))
+
+    def test_item_delete_view(self):
+        for size in SIZES:
+            self.fill(size, user=self.user)
+            item = self.user.cart_items.first()
+            self.measure(
+                'ItemDelete', size,
+                lambda: ItemDelete.as_view()(
+                    self.request('post'), pk=item.pk)
+            )
+            self.assertEqual(self.user.cart_items.count(), size - 1)
+
+    def test_clean_view(self):
+        for size in SIZES:
+            self.fill(size, user=self.user)
+            self.measure('clean', size, lambda: clean(self.request()))
+            self.assertEqual(self.user.cart_items.count(), 0)
+
+    def test_cart_lists(self):
+        # full cart items with products compared to CartLine objects
+        for size in SIZES:
+            self.fill(size, user=self.user)
+            for name in ('with_products', 'lines'):
+                func = getattr(self.user.cart_items, name)
+                self.measure(name, size, func)
+                self.measure_memory(name, size, func)
@@ -0,0 +1,48 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from mock import MagicMock
+
+from cart import cache as cart_cache
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'cart-tests',
+    }
+})
+class TestCartCache(TestCase):
+    def setUp(self):
+        cart_cache.get_cache().clear()
+        cart_cache.reset_stats()
+        self.user = get_user_model().objects.create_user('test', 'password')
+
+    def test_lookup_is_cached_until_cart_changed(self):
+        get_cart = MagicMock(return_value={'Order': {}})
+
+        self.user.cart_items.cached('get_cart', get_cart, 'key')
+        self.user.cart_items.cached('get_cart', get_cart, 'key')
+        self.assertEqual(get_cart.call_count, 1)
+        self.assertEqual(cart_cache.get_stats(), {'hits': 1, 'misses': 1})
+
+        self.user.cart_items.touch()
+        self.user.cart_items.cached('get_cart', get_cart, 'key')
+        self.assertEqual(get_cart.call_count, 2)
+        self.assertEqual(cart_cache.get_stats(), {'hits': 1, 'misses': 2})
+
+    def test_arguments_are_part_of_key(self):
+        get_cart = MagicMock(return_value={'Order': {}})
+
+        self.user.cart_items.cached('get_cart', get_cart, 'key')
+        self.user.cart_items.cached('get_cart', get_cart, 'other-key')
+        self.assertEqual(get_cart.call_count, 2)
+
+    def test_owners_are_separated(self):
+        other = get_user_model().objects.create_user('other', 'password')
+        get_cart = MagicMock(return_value={'Order': {}})
+
+        self.user.cart_items.cached('get_cart', get_cart, 'key')
+        other.cart_items.cached('get_cart', get_cart, 'key')
+        self.assertEqual(get_cart.call_count, 2)
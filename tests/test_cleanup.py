@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management import call_command
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from mock import Mock, patch
+
+from cart import cleanup
+from cart.models import CartItem, CartSummary
+from .dummy import CartTestCase, DummyProduct
+
+
+class TestCleanup(CartTestCase):
+    tempitura_session_key = 'key'
+
+    def get_patches(self):
+        return super(TestCleanup, self).get_patches() + [
+            patch('accounts.models.AnonymousUser',
+                  Mock(return_value=Mock(tempitura_session_key='anon'))),
+        ]
+
+    def setUp(self):
+        super(TestCleanup, self).setUp()
+        self.user = get_user_model().objects.create_user('test', 'password')
+
+    def add(self, days=0, **owner):
+        product = DummyProduct.objects.create(title='product')
+        item = CartItem.objects.create(product=product, **owner)
+        if days:
+            CartItem.objects.filter(pk=item.pk).update(
+                modified=timezone.now() - timedelta(days=days))
+        return item
+
+    def test_orphaned_items_are_removed(self):
+        for _ in range(5):
+            self.add(session_key='expired')
+        item = self.add(user=self.user)
+
+        with patch('cart.cleanup.time.sleep') as sleep:
+            report = cleanup.collect(
+                cleanup.get_orphaned_items(), chunk_size=2, sleep=1)
+
+        self.assertEqual(sleep.call_count, 3)
+        self.assertEqual(report['items'], 5)
+        self.assertEqual(
+            report['models'], {DummyProduct._meta.model_name: 5})
+        self.assertEqual(self.tempitura.count('release'), 5)
+        self.assertEqual(list(CartItem.objects.all()), [item])
+        self.assertEqual(DummyProduct.objects.count(), 1)
+
+    def test_orphan_without_session_key(self):
+        self.add()
+        self.add(user=self.user)
+        self.user.cart_items.rebuild_summary()
+
+        report = cleanup.collect(cleanup.get_orphaned_items())
+
+        self.assertEqual(report['items'], 1)
+        # there is no session to release the product in
+        self.assertEqual(self.tempitura.count('release'), 0)
+        # summaries of other carts are kept
+        self.assertTrue(
+            CartSummary.objects.filter(user_id=self.user.pk).exists())
+        self.assertEqual(self.user.cart_items.count(), 1)
+
+    def test_summaries_of_removed_sessions_are_removed(self):
+        session = SessionStore()
+        session.create()
+        for session_key in ('expired', 'active', session.session_key):
+            CartSummary.objects.create(session_key=session_key)
+        # items of the session are collected first
+        self.add(session_key='active')
+        self.user.cart_items.rebuild_summary()
+
+        self.assertEqual(
+            cleanup.collect_summaries(cleanup.get_orphaned_summaries()), 1)
+
+        self.assertEqual(
+            sorted(CartSummary.objects.filter(
+                user__isnull=True).values_list('session_key', flat=True)),
+            sorted(['active', session.session_key]))
+
+    def test_abandoned_carts_are_removed(self):
+        other = get_user_model().objects.create_user('other', 'password')
+        self.add(days=40, user=self.user)
+        self.add(days=40, user=self.user)
+        # cart changed recently is kept whole
+        self.add(days=40, user=other)
+        self.add(user=other)
+
+        report = cleanup.collect(
+            cleanup.get_abandoned_items(timedelta(days=30)))
+
+        self.assertEqual((report['carts'], report['items']), (1, 2))
+        self.assertEqual(self.user.cart_items.count(), 0)
+        self.assertEqual(self.user.cart_items.summary()['count'], 0)
+        self.assertEqual(other.cart_items.count(), 2)
+
+    def test_dry_run(self):
+        self.add(session_key='expired')
+        self.add(days=40, user=self.user)
+
+        out = StringIO()
+        call_command('cart_collect_garbage', dry_run=True, stdout=out)
+
+        self.assertIn(
+            'Orphaned: 1 items of 1 carts would be removed', out.getvalue())
+        self.assertIn(
+            'Abandoned: 1 items of 1 carts would be removed', out.getvalue())
+        self.assertIn(
+            'Summaries of removed sessions: 0 would be removed',
+            out.getvalue())
+        self.assertEqual(CartItem.objects.count(), 2)
+        self.assertEqual(self.tempitura.count('release'), 0)
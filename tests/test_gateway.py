@@ -0,0 +1,166 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, SimpleTestCase
+from django.utils import timezone
+
+from mock import patch
+
+from cart.gateway import CartGateway
+from cart.models import CartItem
+from cart.remote import RemoteTimeout
+from cart.transport import HTTPTransport
+from cart.views import clean
+from .dummy import CartTestCase, DummyProduct
+from .fake_server import FakeTempituraServer
+from .fake_tempitura import FakeTempitura
+
+
+class TestCartGateway(SimpleTestCase):
+    def setUp(self):
+        self.tempitura = FakeTempitura(latency=0.2)
+        for patcher in self.tempitura.patchers():
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.gateway = CartGateway()
+
+    def call_in_threads(self, func, args_list):
+        results = [None] * len(args_list)
+
+        def run(index, args):
+            try:
+                results[index] = func(*args)
+            except Exception as e:
+                results[index] = e
+
+        threads = [
+            threading.Thread(target=run, args=(index, args))
+            for index, args in enumerate(args_list)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_identical_reads_are_coalesced(self):
+        results = self.call_in_threads(
+            self.gateway.get_cart, [('key',)] * 5 + [('other',)])
+
+        self.assertEqual(self.tempitura.count('get_cart'), 2)
+        self.assertEqual(
+            results, [{'Order': {'HandlingCharges': '2.5'}}] * 6)
+
+    def test_errors_are_shared(self):
+        def expired(*args, **kwargs):
+            time.sleep(0.2)
+            raise FakeTempitura.APIError('expired')
+
+        with patch.object(
+                self.tempitura, 'get_ticket_expiration',
+                side_effect=expired) as call:
+            results = self.call_in_threads(
+                self.gateway.get_ticket_expiration, [('key',)] * 3)
+
+        self.assertEqual(call.call_count, 1)
+        for result in results:
+            self.assertIsInstance(result, FakeTempitura.APIError)
+
+    def test_writes_are_not_coalesced(self):
+        self.call_in_threads(
+            self.gateway.bulk_release_tickets, [('key', [(1, 1)])] * 2)
+
+        self.assertEqual(self.tempitura.count('bulk_release_tickets'), 2)
+        self.assertEqual(self.tempitura.max_in_flight, 2)
+
+    def test_writes_run_in_calling_thread(self):
+        threads = []
+        with patch.object(
+                self.tempitura, 'bulk_release_tickets',
+                side_effect=lambda *args: threads.append(
+                    threading.current_thread())):
+            self.gateway.bulk_release_tickets('key', [(1, 1)])
+
+        self.assertEqual(threads, [threading.current_thread()])
+
+
+class TestHTTPTransport(SimpleTestCase):
+    def setUp(self):
+        self.tempitura = FakeTempitura()
+        for patcher in self.tempitura.patchers():
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.server = FakeTempituraServer(self.tempitura).__enter__()
+        self.addCleanup(self.server.__exit__)
+
+        self.gateway = CartGateway(transport=HTTPTransport(self.server.url))
+
+    def test_connections_are_kept_alive(self):
+        for _ in range(3):
+            self.gateway.get_cart('key')
+        self.gateway.bulk_release_tickets('key', [(1, 1)])
+
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.tempitura.calls[-1], (
+            'bulk_release_tickets', ('key', [[1, 1]])))
+
+    def test_result_is_decoded(self):
+        self.tempitura.expiration = timezone.now()
+
+        self.assertEqual(
+            self.gateway.get_ticket_expiration('key'),
+            self.tempitura.expiration)
+
+    def test_errors(self):
+        with patch.object(
+                self.tempitura, 'get_cart',
+                side_effect=FakeTempitura.APIError('expired')):
+            with self.assertRaises(FakeTempitura.APIError):
+                self.gateway.get_cart('key')
+
+    def test_timeout(self):
+        self.tempitura.latency = 0.2
+        gateway = CartGateway(timeout=0.05, transport=self.gateway.transport)
+
+        with self.assertRaises(RemoteTimeout):
+            gateway.get_cart('key')
+
+        # the next call doesn't join the timed out one
+        self.tempitura.latency = 0
+        self.assertTrue(gateway.get_cart('key'))
+
+
+class TestCleanView(CartTestCase):
+    tempitura_session_key = 'key'
+
+    def setUp(self):
+        super(TestCleanView, self).setUp()
+        self.user = get_user_model().objects.create_user('test', 'password')
+        product = DummyProduct.objects.create(title='product')
+        CartItem.objects.create(product=product, user=self.user)
+
+    def clean(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        return clean(request)
+
+    def test_products_are_released_by_transfer(self):
+        response = self.clean()
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.tempitura.count('transfer_session'), 1)
+        self.assertEqual(self.tempitura.count('release'), 0)
+        self.assertEqual(self.user.cart_items.count(), 0)
+
+    def test_transfer_timeout(self):
+        with patch.object(
+                self.tempitura, 'transfer_session',
+                side_effect=RemoteTimeout('transfer_session')):
+            response = self.clean()
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.tempitura.count('release'), 1)
+        self.assertEqual(self.user.cart_items.count(), 0)
+        self.assertFalse(DummyProduct.objects.exists())
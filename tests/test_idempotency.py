@@ -0,0 +1,87 @@
+from django.contrib.auth import get_user_model
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from mock import patch
+
+from cart import cache as cart_cache
+from cart.models import CartItem, RequestInProgress
+from cart.utils import get_idempotency_key
+from .dummy import CartTestCase, DummyProduct
+from .fake_tempitura import FakeTempitura
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'cart-tests',
+    }
+})
+class TestIdempotentNew(CartTestCase):
+    tempitura_session_key = 'key'
+
+    def setUp(self):
+        super(TestIdempotentNew, self).setUp()
+        cart_cache.get_cache().clear()
+        self.user = get_user_model().objects.create_user('test', 'password')
+
+    def new(self, idempotency_key):
+        product = DummyProduct.objects.create(title='seat')
+        return self.user.cart_items.new(
+            product, idempotency_key=idempotency_key)
+
+    def test_repeated_request_returns_item(self):
+        item = self.new('request-1')
+
+        self.assertEqual(self.new('request-1'), item)
+
+        self.assertEqual(self.tempitura.count('add_to_cart'), 1)
+        self.assertEqual(CartItem.objects.count(), 1)
+        # product of the repeated request is deleted
+        self.assertEqual(DummyProduct.objects.count(), 1)
+        self.assertEqual(
+            self.user.cart_items.get_by_idempotency_key('request-1'), item)
+
+    def test_other_keys_add_items(self):
+        self.new('request-1')
+        self.new('request-2')
+        self.new(None)
+
+        self.assertEqual(self.tempitura.count('add_to_cart'), 3)
+        self.assertIsNone(
+            self.user.cart_items.get_by_idempotency_key('request-3'))
+
+    def test_request_in_progress(self):
+        cart_cache.claim_idempotency_key(
+            cart_cache.owner_key(user_id=self.user.pk), 'request-1')
+
+        with self.assertRaises(RequestInProgress):
+            self.new('request-1')
+
+        self.assertFalse(DummyProduct.objects.exists())
+        self.assertEqual(self.tempitura.count('add_to_cart'), 0)
+
+    def test_failed_request_can_be_repeated(self):
+        with patch.object(
+                DummyProduct, 'add_to_cart_callback',
+                side_effect=FakeTempitura.APIError('error')):
+            with self.assertRaises(FakeTempitura.APIError):
+                self.new('request-1')
+
+        self.new('request-1')
+        self.assertEqual(CartItem.objects.count(), 1)
+
+    def test_removed_item_is_added_again(self):
+        item = self.new('request-1')
+        CartItem.objects.filter(pk=item.pk).delete()
+
+        self.assertNotEqual(self.new('request-1').pk, item.pk)
+
+    def test_key_from_request(self):
+        factory = RequestFactory()
+
+        self.assertEqual(get_idempotency_key(
+            factory.post('/', HTTP_IDEMPOTENCY_KEY='header')), 'header')
+        self.assertEqual(get_idempotency_key(
+            factory.post('/', {'idempotency_key': 'form'})), 'form')
+        self.assertIsNone(get_idempotency_key(factory.post('/')))
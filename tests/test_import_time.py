@@ -0,0 +1,89 @@
+"""Cold import cost of the cart app
+
+The modules are imported by a new interpreter after `django.setup()`, the
+settings come from the environment of the tests. They must not import
+Tempitura, tickets or accounts, which are imported where they are used.
+
+The import time is compared with a reference measured on the same machine,
+the setup of the project without the cart app: the app may add at most
+CART_IMPORT_RATIO (0.5 by default) of the reference time. The best of a few
+runs is taken.
+
+"""
+import json
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+
+RATIO = float(os.environ.get('CART_IMPORT_RATIO', '0.5'))
+
+RUNS = 3
+
+MODULES = [
+    'cart', 'cart.apps', 'cart.gateway', 'cart.models', 'cart.routers',
+    'cart.utils', 'cart.views',
+]
+
+DEFERRED = ('tempitura', 'tickets', 'accounts')
+
+SCRIPT = """
+import json, sys
+from timeit import default_timer
+started = default_timer()
+import django
+from django.conf import settings
+if not {with_cart}:
+    settings.INSTALLED_APPS = [
+        app for app in settings.INSTALLED_APPS
+        if app != 'cart' and not app.startswith('cart.')
+    ]
+django.setup()
+for module in {modules}:
+    __import__(module)
+elapsed = default_timer() - started
+print(json.dumps({{
+    'time': int(elapsed * 1000000),
+    'modules': sorted(sys.modules),
+}}))
+"""
+
+
+def measure_import(modules, with_cart=True):
+    """Set Django up and import `modules` in a new interpreter
+
+    Returns:
+        tuple: (microseconds, names of all imported modules)
+
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    script = SCRIPT.format(modules=repr(modules), with_cart=with_cart)
+    process = subprocess.Popen(
+        [sys.executable, '-c', script],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+        universal_newlines=True)
+    stdout, stderr = process.communicate()
+    if process.returncode:
+        raise AssertionError(stderr)
+
+    result = json.loads(stdout.strip().splitlines()[-1])
+    return result['time'], result['modules']
+
+
+class TestImportTime(TestCase):
+    def test_deferred_imports(self):
+        for module in MODULES:
+            _, modules = measure_import([module])
+
+            self.assertEqual([
+                name for name in modules
+                if name.split('.')[0] in DEFERRED
+            ], [], module)
+
+    def test_import_time(self):
+        reference = min(
+            measure_import([], with_cart=False)[0] for _ in range(RUNS))
+        elapsed = min(measure_import(MODULES)[0] for _ in range(RUNS))
+
+        self.assertLessEqual(elapsed - reference, reference * RATIO)
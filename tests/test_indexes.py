@@ -0,0 +1,60 @@
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import TestCase
+
+from cart.models import CartItem
+from .dummy import DummyProduct
+
+
+class TestCartItemIndexes(TestCase):
+    """Main CartManager queries must not fall back to sequential scans"""
+
+    def setUp(self):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            self.skipTest("EXPLAIN output isn't supported")
+
+        self.user = get_user_model().objects.create_user('test', 'password')
+        self.content_type = ContentType.objects.get_for_model(DummyProduct)
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # the tables are tiny, planner has to be forced to use indexes
+                # when it can
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql, params)
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return '\n'.join(str(row) for row in cursor.fetchall())
+
+    def assertUsesIndex(self, queryset, name):
+        """Query plan of the queryset uses the index with the name"""
+        plan = self.explain(queryset)
+        self.assertIn(name, plan)
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan)
+
+    def test_unpaid_user_items(self):
+        self.assertUsesIndex(
+            self.user.cart_items.all(), 'cart_cartitem_unpaid_user_id')
+        self.assertUsesIndex(
+            self.user.cart_items.values_list('content_type_id', flat=True),
+            'cart_cartitem_unpaid_user_id')
+
+    def test_session_items(self):
+        self.assertUsesIndex(
+            CartItem.objects.filter(session_key='key'),
+            'cart_cartitem_session_key')
+
+    def test_product_lookup(self):
+        self.assertUsesIndex(
+            CartItem.objects.filter(
+                content_type=self.content_type, object_id=1),
+            'cart_cartitem_content_type_object_id')
+
+    def test_user_tickets(self):
+        self.assertUsesIndex(
+            self.user.cart_items.filter(content_type=self.content_type),
+            'cart_cartitem_unpaid_user_id')
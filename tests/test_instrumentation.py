@@ -0,0 +1,65 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from cart.instrumentation import (
+    histogram, instrumented_remote, operation_finished)
+
+
+@override_settings(CART_INSTRUMENTATION=True)
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('test', 'password')
+        # summary row is built by the first read otherwise
+        self.user.cart_items.rebuild_summary()
+        self.operations = []
+        operation_finished.connect(self.receiver)
+        self.addCleanup(operation_finished.disconnect, self.receiver)
+        histogram.reset()
+
+    def receiver(self, sender, **kwargs):
+        self.operations.append(kwargs)
+
+    def test_manager_method(self):
+        self.user.cart_items.total_cost()
+
+        # total_cost is measured with nested summary
+        names = [operation['name'] for operation in self.operations]
+        self.assertEqual(
+            names, ['CartManager.summary', 'CartManager.total_cost'])
+        self.assertEqual(self.operations[-1]['kind'], 'manager')
+        self.assertEqual(self.operations[-1]['queries'], 1)
+        self.assertIsNone(self.operations[-1]['error'])
+
+    def test_remote_call_error(self):
+        def get_cart(tempitura_session_key):
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            instrumented_remote(get_cart)('key')
+
+        operation, = self.operations
+        self.assertEqual(operation['name'], 'tempitura.get_cart')
+        self.assertEqual(operation['kind'], 'remote')
+        self.assertEqual(operation['queries'], 0)
+        self.assertIsInstance(operation['error'], ValueError)
+
+    def test_histogram_snapshot(self):
+        self.user.cart_items.get_types()
+
+        snapshot = histogram.snapshot()
+        self.assertIn(
+            'cart_operation_seconds_count'
+            '{name="CartManager.get_types",kind="manager"} 1',
+            snapshot
+        )
+        self.assertIn(
+            'cart_operation_queries_total'
+            '{name="CartManager.get_types",kind="manager"} 1',
+            snapshot
+        )
+
+    @override_settings(CART_INSTRUMENTATION=False)
+    def test_disabled(self):
+        self.user.cart_items.total_cost()
+        self.assertEqual(self.operations, [])
@@ -0,0 +1,266 @@
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError
+
+from mock import patch
+
+from cart.models import CartItem, CartLine, release_tickets
+from .dummy import CartTestCase, DummyPerformance, DummyProduct, DummyTicket
+from .fake_tempitura import FakeTempitura
+
+
+class TestCartManager(CartTestCase):
+    def setUp(self):
+        super(TestCartManager, self).setUp()
+        self.user = get_user_model().objects.create_user('test', 'password')
+
+    def add_item(self, amount, **kwargs):
+        product = DummyProduct.objects.create(title='product', cost=amount)
+        return CartItem.objects.create(
+            product=product, user=self.user, **kwargs)
+
+    def test_summary_single_query(self):
+        for amount in range(1, 11):
+            self.add_item(amount, price=amount)
+        self.user.cart_items.rebuild_summary()
+
+        with self.assertNumQueries(1):
+            summary = self.user.cart_items.summary()
+
+        self.assertEqual(summary, {'count': 10, 'sub_total': 55.0})
+
+    def test_summary_empty_cart(self):
+        self.assertEqual(
+            self.user.cart_items.summary(), {'count': 0, 'sub_total': 0.0})
+        self.assertEqual(self.user.cart_items.total_cost(), 0.0)
+
+    def test_paid_items_are_not_counted(self):
+        self.add_item(1, price=1)
+        self.add_item(2, price=2, is_paid=True)
+
+        self.assertEqual(self.user.cart_items.total_cost(), 1.0)
+
+    def test_missing_snapshot_is_filled(self):
+        self.add_item(1, price=1)
+        item = self.add_item(2)
+
+        with patch.object(DummyProduct, 'get_cost', return_value=2.0):
+            self.assertEqual(self.user.cart_items.total_cost(), 3.0)
+
+        item.refresh_from_db()
+        self.assertEqual(item.price, 2.0)
+
+        with self.assertNumQueries(1):
+            self.user.cart_items.total_cost()
+
+    def test_bulk_transfer_to_user(self):
+        for amount in range(1, 6):
+            product = DummyProduct.objects.create(
+                title='product', cost=amount)
+            CartItem.objects.create(
+                product=product, session_key='anon', price=amount)
+        self.user.cart_items.rebuild_summary()
+
+        with patch.object(DummyProduct, 'transfer_to_user_many') as transfer:
+            # savepoint, values, update, summary rebuild and delete, one
+            # product query and release
+            with self.assertNumQueries(8):
+                CartItem.cart_manager.transfer_to_user('anon', self.user)
+
+        products, user = transfer.call_args[0]
+        self.assertEqual(len(products), 5)
+        self.assertEqual(user, self.user)
+
+        self.assertEqual(self.user.cart_items.count(), 5)
+        self.assertFalse(CartItem.objects.filter(session_key='anon').exists())
+
+    def test_set_as_paid(self):
+        items = [self.add_item(amount, price=amount) for amount in (1, 2, 3)]
+
+        with patch.object(DummyProduct, 'checkout_callback_many') as checkout:
+            self.assertEqual(self.user.cart_items.set_as_paid(), 3)
+
+        self.assertEqual(checkout.call_count, 1)
+        self.assertEqual(
+            set(product.pk for product in checkout.call_args[0][0]),
+            set(item.object_id for item in items)
+        )
+        self.assertEqual(self.user.cart_items.count(), 0)
+
+    def test_set_as_paid_empty_cart(self):
+        with patch.object(DummyProduct, 'checkout_callback_many') as checkout:
+            self.assertEqual(self.user.cart_items.set_as_paid(), 0)
+
+        self.assertFalse(checkout.called)
+
+    def test_get_types_query_count(self):
+        for size in (1, 10, 50):
+            CartItem.objects.all().delete()
+            for amount in range(size):
+                self.add_item(amount)
+            self.user.cart_items.rebuild_summary()
+
+            with self.assertNumQueries(1):
+                self.assertEqual(
+                    self.user.cart_items.get_types(),
+                    (DummyProduct._meta.model_name,)
+                )
+
+            with self.assertNumQueries(1):
+                self.assertFalse(self.user.cart_items.is_only_packages())
+
+    def test_empty_cart_is_only_packages(self):
+        self.user.cart_items.rebuild_summary()
+
+        with self.assertNumQueries(1):
+            self.assertTrue(self.user.cart_items.is_only_packages())
+
+
+class TestCartManagerBatches(CartTestCase):
+    tempitura_session_key = 'key'
+
+    def setUp(self):
+        super(TestCartManagerBatches, self).setUp()
+        self.user = get_user_model().objects.create_user('test', 'password')
+
+        self.products = [
+            DummyProduct.objects.create(title='seat', cost=10)
+            for _ in range(10)
+        ]
+        self.user.cart_items.rebuild_summary()
+
+    def test_new_many(self):
+        with patch.object(
+                DummyProduct, 'add_to_cart_callback_many') as callback:
+            # savepoint, insert, summary update, release and select of the
+            # new items
+            with self.assertNumQueries(5):
+                items = self.user.cart_items.new_many(self.products)
+
+        self.assertEqual(callback.call_count, 1)
+        self.assertEqual(self.tempitura.count('remove_expired_tickets'), 1)
+        self.assertEqual(
+            [item.object_id for item in items],
+            [product.pk for product in self.products]
+        )
+        self.assertEqual(self.user.cart_items.total_cost(), 100.0)
+
+    def test_task_is_pending(self):
+        with patch.object(
+                DummyProduct, 'add_to_cart_callback_many',
+                side_effect=FakeTempitura.TaskIsPending):
+            with self.assertRaises(FakeTempitura.TaskIsPending):
+                self.user.cart_items.new_many(self.products)
+
+        self.assertEqual(self.user.cart_items.count(), 0)
+        self.assertFalse(DummyProduct.objects.exists())
+
+    def test_failure_in_the_middle_of_model(self):
+        failing = self.products[4]
+        add_to_cart_callback = DummyProduct.add_to_cart_callback
+
+        def add_or_fail(product, tempitura_session_key, **kwargs):
+            if product.pk == failing.pk:
+                raise FakeTempitura.APIError('sold out')
+            add_to_cart_callback(product, tempitura_session_key, **kwargs)
+
+        with patch.object(DummyProduct, 'add_to_cart_callback', add_or_fail):
+            with self.assertRaises(FakeTempitura.APIError):
+                self.user.cart_items.new_many(self.products)
+
+        # products reserved before the failing one are released
+        self.assertEqual(self.user.cart_items.count(), 0)
+        self.assertEqual(self.tempitura.count('add_to_cart'), 4)
+        self.assertEqual(self.tempitura.count('release'), 4)
+
+    def test_insert_error_releases_products(self):
+        with patch.object(
+                CartItem.objects, 'bulk_create', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.user.cart_items.new_many(self.products)
+
+        self.assertEqual(self.user.cart_items.count(), 0)
+        self.assertEqual(self.tempitura.count('add_to_cart'), 10)
+        self.assertEqual(self.tempitura.count('release'), 10)
+
+    def test_remove_many(self):
+        with patch.object(DummyProduct, 'add_to_cart_callback_many'):
+            items = self.user.cart_items.new_many(self.products)
+
+        other = get_user_model().objects.create_user('other', 'password')
+        product = DummyProduct.objects.create(title='other')
+        other_item = CartItem.objects.create(product=product, user=other)
+
+        ids = [item.pk for item in items[:5]] + [other_item.pk]
+        self.assertEqual(self.user.cart_items.remove_many(ids), 5)
+
+        self.assertEqual(self.tempitura.count('release'), 5)
+        self.assertEqual(self.user.cart_items.count(), 5)
+        self.assertEqual(DummyProduct.objects.count(), 6)
+        self.assertEqual(other.cart_items.count(), 1)
+
+    def test_remove_many_without_release(self):
+        with patch.object(DummyProduct, 'add_to_cart_callback_many'):
+            self.user.cart_items.new_many(self.products)
+
+        self.assertEqual(self.user.cart_items.remove_many(release=False), 10)
+
+        self.assertEqual(self.tempitura.count('release'), 0)
+        self.assertEqual(self.user.cart_items.count(), 0)
+        self.assertFalse(DummyProduct.objects.exists())
+
+    def test_with_products(self):
+        with patch.object(DummyProduct, 'add_to_cart_callback_many'):
+            self.user.cart_items.new_many(self.products)
+        product = self.products[0]
+        CartItem.objects.filter(object_id=product.pk).update(
+            object_id=product.pk + 1000)
+
+        # items and one query per product model
+        with self.assertNumQueries(2):
+            items = self.user.cart_items.with_products()
+            titles = [str(item) for item in items]
+
+        self.assertEqual(titles, ['Removed item'] + ['seat'] * 9)
+
+    def test_lines(self):
+        with patch.object(DummyProduct, 'add_to_cart_callback_many'):
+            items = self.user.cart_items.new_many(self.products[:2])
+        CartItem.objects.filter(pk=items[1].pk).update(price=None)
+
+        # values of items and one query per product model
+        with self.assertNumQueries(2):
+            lines = self.user.cart_items.lines()
+
+        self.assertEqual(lines, [
+            CartLine(item.pk, 'seat', 10.0, DummyProduct._meta.model_name,
+                     None)
+            for item in items
+        ])
+
+
+class TestReleaseTickets(CartTestCase):
+    def setUp(self):
+        super(TestReleaseTickets, self).setUp()
+        performance = DummyPerformance.objects.create(tempitura_no=1)
+        self.tickets = [
+            DummyTicket.objects.create(
+                performance=performance, li_seq_no=li_seq_no)
+            for li_seq_no in range(5)
+        ]
+
+    def test_failed_batch_doesnt_stop_release(self):
+        released = []
+
+        def release(tempitura_session_key, batch):
+            if not released:
+                released.append(None)
+                raise FakeTempitura.APIError('error')
+            released.append(batch)
+
+        with patch.object(
+                self.tempitura, 'bulk_release_tickets', side_effect=release):
+            release_tickets(
+                'key', [ticket.pk for ticket in self.tickets], batch_size=2)
+
+        self.assertEqual(released, [None, [(1, 2), (1, 3)], [(1, 4)]])
+        self.assertFalse(DummyTicket.objects.exists())
@@ -0,0 +1,55 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from cart.middleware import AnonymousCart
+
+
+class TestAnonymousCart(TestCase):
+    def setUp(self):
+        self.middleware = AnonymousCart()
+
+        self.session = SessionStore()
+        self.session.create()
+
+        self.request = RequestFactory().get('/')
+        self.request.session = self.session
+        self.request.user = AnonymousUser()
+
+    def test_no_queries_without_cart_access(self):
+        with self.assertNumQueries(0):
+            self.middleware.process_request(self.request)
+
+        self.assertEqual(
+            self.request.session['anonymous_session_key'],
+            self.session.session_key
+        )
+
+    def test_session_key_is_not_rewritten(self):
+        self.middleware.process_request(self.request)
+        self.session.modified = False
+
+        self.middleware.process_request(self.request)
+        self.assertFalse(self.session.modified)
+
+    def test_cart_items_resolved_once(self):
+        self.middleware.process_request(self.request)
+
+        # session lookup and count
+        with self.assertNumQueries(2):
+            self.assertEqual(self.request.user.cart_items.count(), 0)
+
+        # session object is memoized
+        with self.assertNumQueries(1):
+            self.assertEqual(self.request.user.cart_items.count(), 0)
+
+    def test_authenticated_user(self):
+        self.request.user = get_user_model().objects.create_user(
+            'test', 'password')
+
+        with self.assertNumQueries(0):
+            self.middleware.process_request(self.request)
+
+        self.assertNotIn('anonymous_session_key', self.request.session)
@@ -0,0 +1,106 @@
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from mock import patch
+
+from cart import cache as cart_cache
+from cart import outbox
+from cart.models import CartItem, OutboxOperation
+from cart.views import clean
+from .dummy import CartTestCase, DummyProduct
+from .fake_tempitura import FakeTempitura
+
+
+@override_settings(CART_OUTBOX=True)
+class TestOutbox(CartTestCase):
+    def setUp(self):
+        super(TestOutbox, self).setUp()
+        self.user = get_user_model().objects.create_user('test', 'password')
+
+    def test_item_delete_is_deferred(self):
+        product = DummyProduct.objects.create(title='product')
+        item = CartItem.objects.create(product=product, user=self.user)
+
+        item.delete('key')
+
+        self.assertEqual(self.user.cart_items.count(), 0)
+        self.assertEqual(self.tempitura.count('release'), 0)
+        self.assertTrue(DummyProduct.objects.exists())
+
+        self.assertEqual(outbox.drain(workers=1), 1)
+
+        self.assertEqual(self.tempitura.count('release'), 1)
+        self.assertFalse(DummyProduct.objects.exists())
+        self.assertFalse(OutboxOperation.objects.exists())
+
+    def test_clean_transfers_session_synchronously(self):
+        product = DummyProduct.objects.create(title='product')
+        CartItem.objects.create(product=product, user=self.user)
+        request = RequestFactory().get('/')
+        request.user = self.user
+
+        clean(request)
+
+        self.assertEqual(self.tempitura.count('transfer_session'), 1)
+        self.assertEqual(self.user.cart_items.count(), 0)
+        self.assertFalse(OutboxOperation.objects.filter(
+            operation=OutboxOperation.TRANSFER_SESSION).exists())
+
+    def test_cart_cache_is_invalidated_when_done(self):
+        product = DummyProduct.objects.create(title='product')
+        item = CartItem.objects.create(product=product, user=self.user)
+        owner = cart_cache.owner_key(user_id=self.user.pk)
+
+        item.delete('key')
+        # the cart is read before the worker releases the product
+        version = cart_cache.get_version(owner)
+
+        outbox.drain(workers=1)
+
+        self.assertNotEqual(cart_cache.get_version(owner), version)
+
+    def test_releases_are_coalesced(self):
+        for tickets in ([[1, 1], [1, 2]], [[1, 2], [2, 1]]):
+            OutboxOperation.objects.enqueue(
+                OutboxOperation.RELEASE_TICKETS, 'key', tickets=tickets)
+        OutboxOperation.objects.enqueue(
+            OutboxOperation.RELEASE_TICKETS, 'other', tickets=[[3, 1]])
+
+        self.assertEqual(outbox.drain(workers=1), 3)
+
+        self.assertEqual(self.tempitura.calls, [
+            ('bulk_release_tickets', ('key', [(1, 1), (1, 2), (2, 1)])),
+            ('bulk_release_tickets', ('other', [(3, 1)])),
+        ])
+
+    def test_failed_operation_is_retried(self):
+        operation = OutboxOperation.objects.enqueue(
+            OutboxOperation.RELEASE_TICKETS, 'key', tickets=[[1, 1]])
+
+        with patch.object(
+                self.tempitura, 'bulk_release_tickets',
+                side_effect=FakeTempitura.APIError('error')):
+            outbox.drain(workers=1)
+
+        operation.refresh_from_db()
+        self.assertEqual(operation.attempts, 1)
+        self.assertFalse(operation.is_failed)
+        self.assertGreater(operation.next_attempt_at, timezone.now())
+
+        # not claimed again before the backoff
+        self.assertEqual(outbox.drain(workers=1), 0)
+
+    @override_settings(CART_OUTBOX_MAX_ATTEMPTS=1)
+    def test_operation_fails_after_max_attempts(self):
+        operation = OutboxOperation.objects.enqueue(
+            OutboxOperation.RELEASE_TICKETS, 'key', tickets=[[1, 1]])
+
+        with patch.object(
+                self.tempitura, 'bulk_release_tickets',
+                side_effect=FakeTempitura.APIError('error')):
+            outbox.drain(workers=1)
+
+        operation.refresh_from_db()
+        self.assertTrue(operation.is_failed)
@@ -0,0 +1,73 @@
+import time
+
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from cart.remote import RemoteTimeout, call_concurrently
+
+
+def sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def fail():
+    raise ValueError('fail')
+
+
+class TestCallConcurrently(SimpleTestCase):
+    def test_calls_run_concurrently(self):
+        start = time.time()
+        results = call_concurrently([
+            (sleep, (0.2,), {}),
+            (sleep, (0.2,), {}),
+        ])
+
+        self.assertLess(time.time() - start, 0.35)
+        self.assertEqual(results, [(0.2, None), (0.2, None)])
+
+    def test_errors_are_returned(self):
+        (result, error), = call_concurrently([(fail, (), {})])
+
+        self.assertIsNone(result)
+        self.assertIsInstance(error, ValueError)
+
+    def test_deadline(self):
+        (result, error), = call_concurrently(
+            [(sleep, (0.5,), {})], timeout=0.1)
+
+        self.assertIsNone(result)
+        self.assertIsInstance(error, RemoteTimeout)
+
+    @override_settings(CART_TEMPITURA_CONCURRENCY=0)
+    def test_sequential_mode(self):
+        start = time.time()
+        results = call_concurrently([
+            (sleep, (0.1,), {}),
+            (sleep, (0.1,), {}),
+        ])
+
+        self.assertGreaterEqual(time.time() - start, 0.2)
+        self.assertEqual(results, [(0.1, None), (0.1, None)])
+
+    @override_settings(CART_TEMPITURA_CONCURRENCY=1)
+    def test_deadline_starts_with_the_call(self):
+        # the second call waits for the first one, it isn't counted
+        results = call_concurrently([
+            (sleep, (0.15,), {}),
+            (sleep, (0.15,), {}),
+        ], timeout=0.2)
+
+        self.assertEqual(results, [(0.15, None), (0.15, None)])
+
+    @override_settings(CART_TEMPITURA_CONCURRENCY=1)
+    def test_timed_out_call_doesnt_block_next_ones(self):
+        start = time.time()
+        (_, error), result = call_concurrently([
+            (sleep, (0.5,), {}),
+            (sleep, (0.05,), {}),
+        ], timeout=0.1)
+
+        self.assertLess(time.time() - start, 0.4)
+        self.assertIsInstance(error, RemoteTimeout)
+        self.assertEqual(result, (0.05, None))
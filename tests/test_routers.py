@@ -0,0 +1,145 @@
+"""Cart replica routing
+
+The router and the middleware are tested without a replica. Queries are
+checked on a real replica when the test settings define a `replica`
+database alias, e.g. a second SQLite database mirroring the default one:
+
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    }
+
+"""
+import time
+import unittest
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.test import TestCase, TransactionTestCase
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.http import HttpResponse
+
+from mock import patch
+
+from cart import routers
+from cart.middleware import CartReplicaStickiness
+from cart.models import CartItem
+from .dummy import DummyProduct, create_tables, drop_tables
+
+
+@override_settings(CART_REPLICA_DATABASE='replica')
+@patch('cart.routers.in_primary_transaction', lambda: False)
+class TestCartRouter(TestCase):
+    def setUp(self):
+        routers.reset()
+        self.addCleanup(routers.reset)
+        self.router = routers.CartRouter()
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.router.db_for_read(CartItem), 'replica')
+        self.assertIsNone(self.router.db_for_read(get_user_model()))
+
+    def test_write_pins_to_primary(self):
+        self.assertEqual(self.router.db_for_write(CartItem), DEFAULT_DB_ALIAS)
+
+        self.assertTrue(routers.has_written())
+        self.assertEqual(self.router.db_for_read(CartItem), DEFAULT_DB_ALIAS)
+
+    def test_mutation_pins_to_primary(self):
+        routers.on_primary(lambda: None)()
+
+        self.assertFalse(routers.has_written())
+        self.assertEqual(self.router.db_for_read(CartItem), DEFAULT_DB_ALIAS)
+
+    def test_reads_in_transaction_go_to_primary(self):
+        with patch('cart.routers.in_primary_transaction', lambda: True):
+            self.assertEqual(
+                self.router.db_for_read(CartItem), DEFAULT_DB_ALIAS)
+
+    @override_settings(CART_REPLICA_DATABASE=None)
+    def test_without_replica(self):
+        self.assertIsNone(self.router.db_for_read(CartItem))
+        self.assertIsNone(self.router.db_for_write(CartItem))
+        self.assertFalse(routers.is_pinned())
+
+
+@override_settings(CART_REPLICA_DATABASE='replica')
+class TestCartReplicaStickiness(TestCase):
+    def setUp(self):
+        self.addCleanup(routers.reset)
+        self.middleware = CartReplicaStickiness()
+
+        self.session = SessionStore()
+        self.session.create()
+
+        self.request = RequestFactory().get('/')
+        self.request.session = self.session
+
+    def test_owner_sticks_after_write(self):
+        self.middleware.process_request(self.request)
+        self.assertFalse(routers.is_pinned())
+
+        routers.CartRouter().db_for_write(CartItem)
+        self.middleware.process_response(self.request, HttpResponse())
+        self.assertFalse(routers.is_pinned())
+
+        self.middleware.process_request(self.request)
+        self.assertTrue(routers.is_pinned())
+
+    def test_stickiness_expires(self):
+        self.session[CartReplicaStickiness.session_key] = time.time() - 1
+
+        self.middleware.process_request(self.request)
+
+        self.assertFalse(routers.is_pinned())
+
+
+@unittest.skipUnless(
+    'replica' in settings.DATABASES, "there is no replica database")
+@override_settings(CART_REPLICA_DATABASE='replica')
+class TestReplicaQueries(TransactionTestCase):
+    multi_db = True
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestReplicaQueries, cls).setUpClass()
+        create_tables()
+
+    @classmethod
+    def tearDownClass(cls):
+        drop_tables()
+        super(TestReplicaQueries, cls).tearDownClass()
+
+    def setUp(self):
+        patcher = patch.object(router, 'routers', [routers.CartRouter()])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        routers.reset()
+        self.addCleanup(routers.reset)
+
+        self.user = get_user_model().objects.create_user('test', 'password')
+        product = DummyProduct.objects.create(title='product')
+        CartItem.objects.create(product=product, user=self.user, price=1)
+
+    def count_queries(self, alias, func):
+        with CaptureQueriesContext(connections[alias]) as queries:
+            func()
+        return len(queries)
+
+    def test_reads_go_to_replica(self):
+        routers.reset()
+
+        self.assertEqual(
+            self.count_queries('replica', self.user.cart_items.count), 1)
+        self.assertEqual(
+            self.count_queries(
+                DEFAULT_DB_ALIAS, self.user.cart_items.count), 0)
+
+    def test_reads_after_write_go_to_primary(self):
+        # item created in setUp
+        self.assertEqual(
+            self.count_queries('replica', self.user.cart_items.count), 0)
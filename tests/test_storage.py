@@ -0,0 +1,167 @@
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.cache import SessionStore
+from django.test.utils import override_settings
+
+from mock import patch
+
+from cart.models import CartItem
+from cart.storage import SessionCart
+from .dummy import CartTestCase, DummyProduct
+
+
+# SessionCart is meant for sessions kept outside of the database
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'cart-tests',
+    }
+}, SESSION_CACHE_ALIAS='default')
+class TestSessionCart(CartTestCase):
+    def get_patches(self):
+        return super(TestSessionCart, self).get_patches() + [
+            patch.object(SessionCart, 'tempitura_session_key', 'key'),
+        ]
+
+    def setUp(self):
+        super(TestSessionCart, self).setUp()
+
+        self.session = SessionStore()
+        self.session.create()
+        self.cart = SessionCart(self.session)
+
+    def add(self, cost):
+        product = DummyProduct.objects.create(title='product', cost=cost)
+        return self.cart.new(product)
+
+    def test_new_does_not_touch_database(self):
+        product = DummyProduct.objects.create(title='product', cost=2)
+
+        with self.assertNumQueries(0):
+            item = self.cart.new(product)
+
+        self.assertEqual(item.product, product)
+        self.assertEqual(self.tempitura.count('add_to_cart'), 1)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_summary(self):
+        self.add(1)
+        self.add(2)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.cart.summary(), {'count': 2, 'sub_total': 3.0})
+            self.assertEqual(
+                self.cart.get_types(), (DummyProduct._meta.model_name,))
+
+    def test_queryset_api(self):
+        first = self.add(1)
+        second = self.add(2)
+
+        items = self.cart.order_by('-id')
+        self.assertEqual([item.id for item in items], [second.id, first.id])
+        self.assertEqual(self.cart.all().get(pk=str(first.id)).price, 1.0)
+
+        with self.assertRaises(CartItem.DoesNotExist):
+            self.cart.all().get(pk=100)
+
+        self.cart.filter(pk__in=[first.id]).delete()
+        self.assertEqual(self.cart.count(), 1)
+
+    def test_item_delete(self):
+        item = self.add(1)
+
+        item.delete('key')
+
+        self.assertEqual(self.cart.count(), 0)
+        self.assertEqual(self.tempitura.count('release'), 1)
+        self.assertFalse(DummyProduct.objects.exists())
+
+    def test_transfer_to_user(self):
+        user = get_user_model().objects.create_user('test', 'password')
+        self.add(1)
+        self.add(2)
+
+        with patch.object(DummyProduct, 'transfer_to_user_many') as transfer:
+            self.cart.transfer_to_user(user)
+
+        self.assertEqual(len(transfer.call_args[0][0]), 2)
+        self.assertEqual(user.cart_items.total_cost(), 3.0)
+        self.assertEqual(self.cart.count(), 0)
+
+    def test_set_as_paid(self):
+        self.session.save()
+        self.add(1)
+
+        self.assertEqual(self.cart.set_as_paid(), 1)
+
+        item = CartItem.objects.get()
+        self.assertTrue(item.is_paid)
+        self.assertEqual(item.session_key, self.session.session_key)
+        self.assertEqual(self.cart.count(), 0)
+
+    def test_transfer_keeps_concurrent_adds(self):
+        user = get_user_model().objects.create_user('test', 'password')
+        self.add(1)
+        # another request of the session adds an item after this one read it
+        other = SessionCart(SessionStore(self.session.session_key))
+        other.new(DummyProduct.objects.create(title='product', cost=2))
+
+        with patch.object(DummyProduct, 'transfer_to_user_many'):
+            self.cart.transfer_to_user(user)
+
+        self.assertEqual(user.cart_items.total_cost(), 3.0)
+        stored = SessionCart(SessionStore(self.session.session_key))
+        self.assertEqual(stored.count(), 0)
+
+    def test_set_as_paid_keeps_concurrent_adds(self):
+        self.add(1)
+        other = SessionCart(SessionStore(self.session.session_key))
+        other.new(DummyProduct.objects.create(title='product', cost=2))
+
+        self.assertEqual(self.cart.set_as_paid(), 2)
+
+        self.assertEqual(CartItem.objects.filter(is_paid=True).count(), 2)
+        stored = SessionCart(SessionStore(self.session.session_key))
+        self.assertEqual(stored.count(), 0)
+
+    def test_concurrent_adds_are_kept(self):
+        # two requests of the session read it before either adds an item
+        first = SessionCart(SessionStore(self.session.session_key))
+        second = SessionCart(SessionStore(self.session.session_key))
+        self.assertEqual((first.count(), second.count()), (0, 0))
+
+        first.new(DummyProduct.objects.create(title='product', cost=1))
+        second.new(DummyProduct.objects.create(title='product', cost=2))
+
+        # the end of the requests doesn't write their own carts over
+        self.assertFalse(first.session.modified)
+        self.assertFalse(second.session.modified)
+
+        stored = SessionCart(SessionStore(self.session.session_key))
+        self.assertEqual(
+            [(item.id, item.price) for item in stored.order_by('id')],
+            [(1, 1.0), (2, 2.0)]
+        )
+
+    def test_with_products(self):
+        first = self.add(1)
+        self.add(2)
+
+        with self.assertNumQueries(1):
+            items = self.cart.with_products()
+            self.assertEqual(
+                [item.product.cost for item in items], [1.0, 2.0])
+
+        self.assertEqual(items[0].id, first.id)
+
+    def test_lines(self):
+        first = self.add(1)
+        second = self.add(2)
+
+        with self.assertNumQueries(1):
+            lines = self.cart.lines()
+
+        self.assertEqual(
+            [(line.id, line.cost) for line in lines],
+            [(first.id, 1.0), (second.id, 2.0)]
+        )
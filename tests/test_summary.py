@@ -0,0 +1,120 @@
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from cart.models import CartItem, CartSummary
+from .dummy import CartTestCase, DummyProduct
+
+
+class TestCartSummary(CartTestCase):
+    tempitura_session_key = 'key'
+
+    def setUp(self):
+        super(TestCartSummary, self).setUp()
+        self.user = get_user_model().objects.create_user('test', 'password')
+
+    def create_products(self, *costs):
+        return [
+            DummyProduct.objects.create(title='product', cost=cost)
+            for cost in costs
+        ]
+
+    def get_summary(self, **owner):
+        summary = CartSummary.objects.get(**owner)
+        return summary.item_count, summary.subtotal, summary.get_types()
+
+    def test_new_items_are_added(self):
+        first, second, third = self.create_products(1, 2, 3)
+
+        self.user.cart_items.new(first)
+        self.user.cart_items.new_many([second, third])
+
+        self.assertEqual(
+            self.get_summary(user=self.user),
+            (3, 6.0, (DummyProduct._meta.model_name,))
+        )
+        self.assertEqual(
+            CartSummary.objects.get(user=self.user).get_content_type_ids(),
+            [CartItem.objects.first().content_type_id]
+        )
+
+    def test_removed_items_are_subtracted(self):
+        items = self.user.cart_items.new_many(self.create_products(1, 2, 3))
+
+        self.user.cart_items.remove_many([items[0].pk])
+        self.assertEqual(self.get_summary(user=self.user)[:2], (2, 5.0))
+
+        items[1].delete('key')
+        self.assertEqual(self.get_summary(user=self.user)[:2], (1, 3.0))
+
+        self.user.cart_items.remove_many()
+        self.assertEqual(
+            self.get_summary(user=self.user), (0, 0.0, ()))
+
+    def test_paid_items_are_subtracted(self):
+        self.user.cart_items.new_many(self.create_products(1, 2))
+
+        self.user.cart_items.set_as_paid()
+
+        self.assertEqual(self.user.cart_items.summary(), {
+            'count': 0, 'sub_total': 0.0})
+        self.assertTrue(self.user.cart_items.is_only_packages())
+
+    def test_transfer_to_user(self):
+        for product in self.create_products(1, 2):
+            CartItem.objects.create(
+                product=product, session_key='anon', price=product.cost)
+        CartSummary.objects.rebuild(session_key='anon')
+
+        CartItem.cart_manager.transfer_to_user('anon', self.user)
+
+        self.assertEqual(self.get_summary(user=self.user)[:2], (2, 3.0))
+        self.assertFalse(
+            CartSummary.objects.filter(session_key='anon').exists())
+
+    def test_empty_cart_read_doesnt_write(self):
+        cart_items = self.user.cart_items
+
+        with self.assertNumQueries(2):
+            self.assertEqual(
+                cart_items.summary(), {'count': 0, 'sub_total': 0.0})
+        self.assertTrue(cart_items.is_only_packages())
+
+        self.assertFalse(CartSummary.objects.exists())
+
+    def test_summary_is_one_lookup(self):
+        self.user.cart_items.new_many(self.create_products(1, 2))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.user.cart_items.summary(), {
+                'count': 2, 'sub_total': 3.0})
+
+        with self.assertNumQueries(1):
+            self.assertFalse(self.user.cart_items.is_only_packages())
+
+    def test_set_expiration(self):
+        self.user.cart_items.new(self.create_products(1)[0])
+        expires_at = timezone.now()
+
+        self.user.cart_items.set_expiration(expires_at)
+        self.assertEqual(
+            CartSummary.objects.get(user=self.user).expires_at, expires_at)
+
+        self.user.cart_items.remove_many()
+        self.assertIsNone(CartSummary.objects.get(user=self.user).expires_at)
+
+    def test_rebuild_command(self):
+        self.user.cart_items.new_many(self.create_products(1, 2))
+        # bulk changes made outside of CartManager
+        CartItem.objects.update(price=5)
+        product = self.create_products(4)[0]
+        CartItem.objects.create(
+            product=product, session_key='anon', price=product.cost)
+
+        out = StringIO()
+        call_command('cart_rebuild_summaries', stdout=out)
+
+        self.assertIn('2 cart summaries rebuilt', out.getvalue())
+        self.assertEqual(self.get_summary(user=self.user)[:2], (2, 10.0))
+        self.assertEqual(self.get_summary(session_key='anon')[:2], (1, 4.0))
@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from mock import patch
+
+from cart import sweeper
+from cart.models import CartItem, CartManager
+from .dummy import CartTestCase, DummyPerformance, DummyTicket
+from .fake_tempitura import FakeTempitura
+
+
+@patch.object(CartManager, 'remove_tickets')
+class TestSweeper(CartTestCase):
+    tempitura_session_key = 'key'
+
+    def setUp(self):
+        super(TestSweeper, self).setUp()
+        self.user = get_user_model().objects.create_user('test', 'password')
+
+        performance = DummyPerformance.objects.create(tempitura_no=1)
+        for li_seq_no in (1, 2):
+            ticket = DummyTicket.objects.create(
+                performance=performance, li_seq_no=li_seq_no)
+            CartItem.objects.create(product=ticket, user=self.user)
+
+    def test_expired_tickets_are_removed(self, remove_tickets):
+        self.tempitura.expiration = timezone.now() - timedelta(minutes=1)
+
+        self.assertEqual(sweeper.sweep(batch_size=10), 1)
+        self.assertEqual(
+            self.tempitura.calls, [('get_ticket_expiration', ('key',))])
+        remove_tickets.assert_called_once_with(batch_size=10)
+
+    def test_active_tickets_are_kept(self, remove_tickets):
+        self.tempitura.expiration = timezone.now() + timedelta(minutes=1)
+
+        self.assertEqual(sweeper.sweep(), 0)
+        self.assertFalse(remove_tickets.called)
+
+    def test_unknown_cart_is_expired(self, remove_tickets):
+        with patch.object(
+                self.tempitura, 'get_ticket_expiration',
+                side_effect=FakeTempitura.APIError('expired')):
+            self.assertEqual(sweeper.sweep(), 1)
+
+        self.assertTrue(remove_tickets.called)
+
+    def test_paid_tickets_are_skipped(self, remove_tickets):
+        CartItem.objects.update(is_paid=True)
+
+        self.assertEqual(sweeper.sweep(), 0)
+        self.assertEqual(self.tempitura.count('get_ticket_expiration'), 0)
+
+
+@override_settings(CART_TEMPITURA_TIMEOUT=0.15, CART_TEMPITURA_CONCURRENCY=2)
+@patch.object(CartManager, 'remove_tickets')
+class TestSweeperLatency(CartTestCase):
+    # every call fits the timeout, a chunk of them doesn't
+    tempitura_latency = 0.1
+
+    def get_patches(self):
+        return super(TestSweeperLatency, self).get_patches() + [
+            patch.object(
+                get_user_model(), 'tempitura_session_key',
+                property(lambda user: 'key{}'.format(user.pk)),
+                create=True),
+        ]
+
+    def setUp(self):
+        super(TestSweeperLatency, self).setUp()
+        performance = DummyPerformance.objects.create(tempitura_no=1)
+        for li_seq_no in range(6):
+            user = get_user_model().objects.create_user(
+                'test{}'.format(li_seq_no), 'password')
+            ticket = DummyTicket.objects.create(
+                performance=performance, li_seq_no=li_seq_no)
+            CartItem.objects.create(product=ticket, user=user)
+
+    def test_whole_chunk_is_checked(self, remove_tickets):
+        self.tempitura.expiration = timezone.now() - timedelta(minutes=1)
+
+        self.assertEqual(sweeper.sweep(chunk_size=6), 6)
+        self.assertEqual(remove_tickets.call_count, 6)
@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.test import RequestFactory
+
+from cart.models import CartItem
+from cart.views import ItemsDelete
+from .dummy import CartTestCase, DummyProduct
+
+
+class TestItemsDelete(CartTestCase):
+    tempitura_session_key = 'key'
+
+    def setUp(self):
+        super(TestItemsDelete, self).setUp()
+        self.user = get_user_model().objects.create_user('test', 'password')
+        self.items = [
+            CartItem.objects.create(
+                product=DummyProduct.objects.create(title='product'),
+                user=self.user)
+            for _ in range(3)
+        ]
+
+    def delete(self, ids):
+        request = RequestFactory().post(
+            reverse('cart:delete_many'), {'ids': ids})
+        request.user = self.user
+        return ItemsDelete.as_view()(request)
+
+    def test_selected_items_are_removed(self):
+        first, second, third = self.items
+
+        response = self.delete([first.pk, 'x', '-1', '', second.pk])
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], reverse('cart:cart'))
+        self.assertEqual(
+            list(self.user.cart_items.values_list('id', flat=True)),
+            [third.pk])
+        self.assertEqual(self.tempitura.count('release'), 2)
+
+    def test_items_of_other_owners_are_ignored(self):
+        other = get_user_model().objects.create_user('other', 'password')
+        item = CartItem.objects.create(
+            product=DummyProduct.objects.create(title='product'), user=other)
+
+        response = self.delete([item.pk, self.items[0].pk])
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(CartItem.objects.filter(pk=item.pk).exists())
+        self.assertEqual(self.user.cart_items.count(), 2)
+        self.assertEqual(self.tempitura.count('release'), 1)
+
+    def test_nothing_to_remove(self):
+        response = self.delete(['x'])
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], reverse('cart:cart'))
+        self.assertEqual(self.user.cart_items.count(), 3)
+        self.assertEqual(self.tempitura.count('release'), 0)
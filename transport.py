@@ -0,0 +1,177 @@
+"""Transports of the Tempitura calls made by `CartGateway`
+
+Calls run in the calling thread and their sockets time out after
+`CART_TEMPITURA_TIMEOUT` seconds, `RemoteTimeout` is raised then.
+
+* `ApiTransport` calls the `tempitura.api` functions, it is the default. The
+  client opens its own connections, so the timeout is set as the default
+  timeout of new sockets while a call is running.
+* `HTTPTransport` is used when `CART_TEMPITURA_URL` is set, e.g. to a
+  Tempitura proxy. Calls are posted as JSON over keep-alive connections, at
+  most `CART_TEMPITURA_POOL_SIZE` idle connections are kept (4 by default).
+
+"""
+import datetime
+import json
+import socket
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from django.utils.six.moves import http_client, queue
+from django.utils.six.moves.urllib.parse import urlsplit
+
+from .remote import RemoteTimeout
+
+
+_timeout_lock = threading.Lock()
+_timeout_state = {'calls': 0, 'previous': None}
+
+
+@contextmanager
+def socket_timeout(timeout):
+    """Default timeout of new sockets while any call is running
+
+    The default is process-wide, sockets opened meanwhile by other threads get
+    the timeout too. It isn't changed when the project has set one.
+
+    """
+    with _timeout_lock:
+        if not _timeout_state['calls']:
+            _timeout_state['previous'] = socket.getdefaulttimeout()
+            if _timeout_state['previous'] is None:
+                socket.setdefaulttimeout(timeout)
+        _timeout_state['calls'] += 1
+    try:
+        yield
+    finally:
+        with _timeout_lock:
+            _timeout_state['calls'] -= 1
+            if not _timeout_state['calls']:
+                socket.setdefaulttimeout(_timeout_state['previous'])
+
+
+class ApiTransport(object):
+    def call(self, name, args, kwargs, timeout):
+        from tempitura import api
+        with socket_timeout(timeout):
+            try:
+                return getattr(api, name)(*args, **kwargs)
+            except socket.timeout:
+                raise RemoteTimeout(name)
+
+
+class TempituraJSONEncoder(json.JSONEncoder):
+    """Users are sent as their id and Tempitura session key"""
+
+    def default(self, obj):
+        if isinstance(obj, (datetime.datetime, datetime.date)):
+            return obj.isoformat()
+        if hasattr(obj, 'tempitura_session_key'):
+            return {
+                'id': getattr(obj, 'pk', None),
+                'tempitura_session_key': obj.tempitura_session_key,
+            }
+        return super(TempituraJSONEncoder, self).default(obj)
+
+
+def parse_expiration(value):
+    return parse_datetime(value) if value else value
+
+
+class HTTPTransport(object):
+    """Calls posted as JSON to `url` over keep-alive connections
+
+    `POST <url>/<name>` with `{"args": [...], "kwargs": {...}}` answers
+    `{"result": ...}` or `{"error": message}`, which is raised as `APIError`.
+
+    """
+    decoders = {
+        'get_ticket_expiration': parse_expiration,
+    }
+
+    def __init__(self, url, pool_size=4):
+        parts = urlsplit(url)
+        if parts.scheme == 'https':
+            self.connection_class = http_client.HTTPSConnection
+        else:
+            self.connection_class = http_client.HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path.rstrip('/')
+        self.pool = queue.LifoQueue(pool_size)
+
+    def connect(self, timeout):
+        return self.connection_class(self.host, self.port, timeout=timeout)
+
+    def get_connection(self, timeout):
+        """Idle connection of the pool or a new one
+
+        Returns:
+            tuple: (connection, is it reused)
+
+        """
+        try:
+            connection = self.pool.get_nowait()
+        except queue.Empty:
+            return self.connect(timeout), False
+
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection, True
+
+    def put_connection(self, connection):
+        try:
+            self.pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def request(self, connection, name, body):
+        connection.request(
+            'POST', '{}/{}'.format(self.path, name), body,
+            {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        return response.status, response.read()
+
+    def call(self, name, args, kwargs, timeout):
+        from tempitura.exceptions import APIError
+        body = json.dumps(
+            {'args': args, 'kwargs': kwargs}, cls=TempituraJSONEncoder)
+
+        connection, is_reused = self.get_connection(timeout)
+        try:
+            try:
+                status, data = self.request(connection, name, body)
+            except (http_client.HTTPException, socket.error) as e:
+                if isinstance(e, socket.timeout) or not is_reused:
+                    raise
+                # the server has closed the idle connection
+                connection.close()
+                connection = self.connect(timeout)
+                status, data = self.request(connection, name, body)
+        except (http_client.HTTPException, socket.error):
+            connection.close()
+            # the call may have been done, like a timed out one
+            raise RemoteTimeout(name)
+        self.put_connection(connection)
+
+        try:
+            response = json.loads(data.decode('utf-8'))
+        except ValueError:
+            response = {}
+        if status != 200 or 'error' in response:
+            raise APIError(response.get('error', 'HTTP {}'.format(status)))
+
+        result = response.get('result')
+        decoder = self.decoders.get(name)
+        return decoder(result) if decoder else result
+
+
+def get_transport():
+    url = getattr(settings, 'CART_TEMPITURA_URL', None)
+    if url:
+        return HTTPTransport(
+            url, getattr(settings, 'CART_TEMPITURA_POOL_SIZE', 4))
+    return ApiTransport()
@@ -1,9 +1,10 @@
 from django.conf.urls import patterns, url
 
-from .views import Cart, ItemDelete, clean
+from .views import Cart, ItemDelete, ItemsDelete, clean
 
 urlpatterns = patterns('cart.views',
     url(r'^$', Cart.as_view(), name='cart'),
     url(r'^delete/(?P<pk>\d+)/$', ItemDelete.as_view(), name='delete'),
+    url(r'^delete/$', ItemsDelete.as_view(), name='delete_many'),
     url(r'^clean/$', clean),
 )
@@ -0,0 +1,62 @@
+from itertools import islice
+
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+
+def chunks(iterable, size):
+    """Split iterable into lists of `size` items, the last one may be shorter
+
+    Whole iterable is returned as one chunk if size is None.
+
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def keyset_chunks(queryset, size, *fields):
+    """Yield chunks of `queryset.values_list(*fields)` ordered by id
+
+    Every chunk is read with `id > last id` instead of OFFSET, so it costs the
+    same however far the walk is. The first field has to be `id`, rows may be
+    deleted between chunks.
+
+    """
+    last_id = 0
+    while True:
+        chunk = list(
+            queryset.filter(id__gt=last_id).order_by('id').values_list(
+                *fields)[:size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1][0]
+
+
+def object_chunks(queryset, size):
+    """Yield chunks of `queryset` objects ordered by id, see keyset_chunks"""
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id).order_by('id')[:size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].pk
+
+
+def get_idempotency_key(request):
+    """Idempotency key of the request
+
+    It is taken from the `Idempotency-Key` header or `idempotency_key` POST
+    parameter, None if there is no one.
+
+    """
+    key = (
+        request.META.get(IDEMPOTENCY_HEADER) or
+        request.POST.get('idempotency_key')
+    )
+    return key[:255] if key else None
@@ -1,17 +1,15 @@
 import logging
-from collections import defaultdict
 
 from django.http import HttpResponseRedirect
-from django.contrib.contenttypes.models import ContentType
 from django.shortcuts import redirect
 from django.utils import timezone
 from django.core.urlresolvers import reverse_lazy
-from django.views.generic import ListView, DeleteView
+from django.views.generic import ListView, DeleteView, View
 
-from tempitura import api
-from tempitura.exceptions import APIError
-from tickets.models import Ticket
+from .gateway import gateway
+from .instrumentation import instrumented
 from .models import CartItem
+from .remote import RemoteTimeout, call_concurrently
 
 
 logger = logging.getLogger("private-project.{}".format(__name__))
@@ -20,41 +18,95 @@ logger = logging.getLogger("private-project.{}".format(__name__))
 class Cart(ListView):
     model = CartItem
     template_name = 'cart/cartitem_list.html'
+    context_object_name = 'cartitem_list'
+    # render CartLine objects instead of cart items and products, see
+    # CartManager.lines. Lines are rendered with `lines_template_name` and
+    # are in the `cartline_list` context variable.
+    render_lines = False
+    lines_template_name = 'cart/cartline_list.html'
+
+    @instrumented('Cart', 'view')
+    def dispatch(self, request, *args, **kwargs):
+        return super(Cart, self).dispatch(request, *args, **kwargs)
+
+    def get_template_names(self):
+        if self.render_lines:
+            return [self.lines_template_name]
+        return super(Cart, self).get_template_names()
+
+    def get_context_object_name(self, object_list):
+        if self.render_lines:
+            return 'cartline_list'
+        return super(Cart, self).get_context_object_name(object_list)
 
     def get_context_data(self, **kwargs):
-        context = super(Cart, self).get_context_data(**kwargs)
-
+        from tempitura.exceptions import APIError
         fees = 0.0
         date_expiration = None
 
         tempitura_session_key = self.request.user.tempitura_session_key
-
-        try:
-            logger.debug("Check cart")
-            result = api.get_cart(
-                tempitura_session_key, cache=True, timeout=30)
+        cart_items = self.request.user.cart_items
+
+        logger.debug("Check cart")
+        # cart and expiration don't depend on each other, so don't wait for
+        # one before asking for another. Results are cached until the cart is
+        # changed, identical calls of other requests in flight are shared.
+        (result, error), (expiration, expiration_error) = call_concurrently([
+            (cart_items.cached,
+             ('get_cart', gateway.get_cart, tempitura_session_key),
+             {}),
+            (cart_items.cached,
+             ('get_ticket_expiration', gateway.get_ticket_expiration,
+              tempitura_session_key),
+             {'as_utc': True}),
+        ])
+
+        # expiration makes sense only for non-empty cart
+        if not error and result:
+            error = expiration_error
+
+        if isinstance(error, RemoteTimeout):
+            logger.warning("Cart can't be checked in time")
+        elif isinstance(error, APIError):
+            logger.debug("There are expired tickets")
+            self.request.user.cart_items.remove_tickets()
+        elif error:
+            raise error
+        else:
             if result:
                 fees = float(result['Order']['HandlingCharges'])
-                date_expiration = api.get_ticket_expiration(
-                    tempitura_session_key,
-                    as_utc=True,
-                    cache=True, timeout=30,
-                )
+                date_expiration = expiration
 
                 if date_expiration and date_expiration < timezone.now():
                     self.request.user.cart_items.remove_tickets()
+                elif date_expiration:
+                    cart_items.set_expiration(date_expiration)
 
             logger.debug("Cart items successfully received")
 
-        except APIError:
-            logger.debug("There are expired tickets")
-            self.request.user.cart_items.remove_tickets()
+        # The list, count and sub total are built from one query, it is done
+        # after tickets removal. Products are loaded with one query per
+        # product model.
+        if self.render_lines:
+            items = cart_items.lines()
+        else:
+            items = cart_items.with_products(self.object_list)
 
         # Do not display expiration time if cart is empty
-        if self.request.user.cart_items.count() == 0:
+        if not items:
             date_expiration = 0
 
-        context['sub_total'] = self.request.user.cart_items.total_cost()
+        if self.render_lines:
+            sub_total = sum((line.cost for line in items), 0.0)
+        elif all(item.price is not None for item in items):
+            sub_total = sum(
+                (item.price * item.quantity for item in items), 0.0)
+        else:
+            sub_total = self.request.user.cart_items.total_cost()
+
+        context = super(Cart, self).get_context_data(
+            object_list=items, **kwargs)
+        context['sub_total'] = sub_total
         context['fees'] = fees
         context['total_cost'] = context['sub_total'] + fees
         context['date_expiration'] = date_expiration
@@ -65,23 +117,28 @@ class Cart(ListView):
         return self.request.user.cart_items.order_by('id')
 
 
+@instrumented('clean', 'view')
 def clean(request):
-    api.transfer_session(request.user)
-
-    model_ids_map = defaultdict(list)
-    for cart_item in request.user.cart_items.all():
-        model = cart_item.content_type.model_class()
-        model_ids_map[model].append(cart_item.object_id)
-
-    for model, ids in model_ids_map.items():
-        ids and model.objects.filter(id__in=ids).delete()
-
-    request.user.cart_items.all().delete()
+    # the transfer is not deferred to the outbox, the next request reads the
+    # new Tempitura session
+    try:
+        gateway.transfer_session(request.user)
+    except RemoteTimeout:
+        # the transfer may be done or not, products are released one by one
+        logger.warning("Session transfer timed out, products are released")
+        request.user.cart_items.remove_many()
+    else:
+        # products are released by the session transfer
+        request.user.cart_items.remove_many(release=False)
 
     return redirect('cart:cart')
 
 
 class ItemDelete(DeleteView):
+    @instrumented('ItemDelete', 'view')
+    def dispatch(self, request, *args, **kwargs):
+        return super(ItemDelete, self).dispatch(request, *args, **kwargs)
+
     def get(self, request, *args, **kwargs):
         return self.post(request)
 
@@ -93,3 +150,20 @@ class ItemDelete(DeleteView):
 
     model = CartItem
     success_url = reverse_lazy('cart:cart')
+
+
+class ItemsDelete(View):
+    """Remove selected cart items, their ids are sent as `ids` list"""
+
+    @instrumented('ItemsDelete', 'view')
+    def dispatch(self, request, *args, **kwargs):
+        return super(ItemsDelete, self).dispatch(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        ids = [
+            item_id for item_id in request.POST.getlist('ids')
+            if item_id.isdigit()
+        ]
+        if ids:
+            request.user.cart_items.remove_many(ids)
+        return redirect('cart:cart')